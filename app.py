@@ -4,7 +4,7 @@ import csv
 from datetime import datetime
 from pdf2image import convert_from_path
 import logging
-from functions.generate_documentos import process_pdf_to_images_and_csv, get_pdf_name_without_extension, generar_entregable_consolidado
+from functions.generate_documentos import process_pdf_to_images_and_csv, process_pdfs_batch, get_pdf_name_without_extension, generar_entregable_consolidado
 from functions.extraer_datos import process_document_ocr
 import zipfile
 from io import BytesIO
@@ -253,9 +253,44 @@ def process_pdf(filename):
     
     return redirect(url_for('documents'))
 
+@app.route('/process_all_pdfs')
+def process_all_pdfs():
+    """Procesar todos los PDFs de /input que aún no tienen documento, en lote"""
+    try:
+        pdf_paths = []
+        if os.path.exists('input'):
+            for filename in sorted(os.listdir('input')):
+                if not filename.lower().endswith('.pdf'):
+                    continue
+                pdf_name = get_pdf_name_without_extension(filename)
+                if os.path.exists(os.path.join('documentos', pdf_name)):
+                    print(f"⚠️  El documento {pdf_name} ya ha sido procesado")
+                    continue
+                pdf_paths.append(os.path.join('input', filename))
+        
+        if not pdf_paths:
+            flash('No hay PDFs pendientes de procesar en /input', 'warning')
+            return redirect(url_for('documents'))
+        
+        print(f"\n🎯 Procesamiento en lote de {len(pdf_paths)} PDFs")
+        resultados = process_pdfs_batch(pdf_paths)
+        
+        exitosos = sum(1 for ok in resultados.values() if ok)
+        if exitosos:
+            flash(f'{exitosos} de {len(pdf_paths)} PDFs procesados exitosamente', 'success')
+        fallidos = [os.path.basename(path) for path, ok in resultados.items() if not ok]
+        if fallidos:
+            flash(f'Error al procesar: {", ".join(fallidos)}', 'error')
+            
+    except Exception as e:
+        print(f"💥 Error inesperado: {str(e)}")
+        flash(f'Error inesperado: {str(e)}', 'error')
+    
+    return redirect(url_for('documents'))
+
 @app.route('/extract_data/<doc_name>')
 def extract_data(doc_name):
-    """Extraer datos con OCR del documento especificado"""
+    """Extraer datos con OCR del documento especificado (?force=1 reprocesa todas las páginas, ?gpu=1 usa EasyOCR en GPU)"""
     try:
         print(f"\n🔍 Iniciando extracción de datos para: {doc_name}")
         
@@ -268,7 +303,9 @@ def extract_data(doc_name):
         
         # Procesar extracción de datos
         print(f"🔄 Procesando OCR...")
-        success = process_document_ocr(doc_name)
+        success = process_document_ocr(doc_name,
+                                       force=request.args.get('force') == '1',
+                                       use_gpu=request.args.get('gpu') == '1')
         
         if success:
             print(f"🎉 Extracción exitosa!")
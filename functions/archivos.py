@@ -0,0 +1,91 @@
+import os
+import shutil
+
+try:
+    import fcntl  # Solo en Linux/Unix, para copias reflink
+except ImportError:
+    fcntl = None
+
+# ioctl FICLONE de Linux: clona un archivo compartiendo bloques (btrfs, xfs)
+FICLONE = 0x40049409
+
+# Formas de copiar los PDFs
+MODOS_COPIA = ('hardlink', 'reflink', 'copy')
+
+def clonar_reflink(src_path, dest_path):
+    """
+    Intenta copiar src_path como reflink (FICLONE), sin duplicar los datos
+    
+    Returns:
+        bool: True si el sistema de archivos lo permitió
+    """
+    if fcntl is None:
+        return False
+    try:
+        with open(src_path, 'rb') as src, open(dest_path, 'wb') as dest:
+            fcntl.ioctl(dest.fileno(), FICLONE, src.fileno())
+        shutil.copystat(src_path, dest_path)
+        return True
+    except OSError:
+        return False
+
+def copiar_datos(src_path, dest_path):
+    """
+    Copia src_path con os.copy_file_range (Linux): los datos se copian dentro del
+    kernel, sin pasar por buffers de Python, y en btrfs/xfs puede quedar como
+    reflink. Después se copian los metadatos, igual que shutil.copy2, que es lo
+    que se usa si el sistema no lo soporta
+    """
+    if hasattr(os, 'copy_file_range'):
+        with open(src_path, 'rb') as src, open(dest_path, 'wb') as dest:
+            try:
+                restante = os.fstat(src.fileno()).st_size
+                while restante > 0:
+                    copiado = os.copy_file_range(src.fileno(), dest.fileno(), restante)
+                    if copiado == 0:
+                        break
+                    restante -= copiado
+                # Si devolvió 0 antes de terminar (origen que se achicó, procfs,
+                # FUSE) la copia quedó incompleta: se repite con shutil.copy2
+                en_kernel = restante == 0
+            except OSError:
+                # Kernel antiguo o copia entre sistemas de archivos no soportada
+                en_kernel = False
+        if en_kernel:
+            shutil.copystat(src_path, dest_path)
+            return
+    shutil.copy2(src_path, dest_path)
+
+def copiar_pdf(copia, link_mode='hardlink'):
+    """
+    Copia un PDF (se ejecuta en los hilos de copia). copia empieza con
+    (src_path, dest_path); el resto de la tupla se ignora.
+    Con link_mode='hardlink' se crea un hardlink (sin copiar bytes) y si no se
+    puede (otro disco) se intenta un reflink; con 'reflink' solo el reflink.
+    Si ninguno es posible, o con 'copy', se copian los datos con copiar_datos
+    
+    Returns:
+        Exception: El error de la copia, o None si se copió bien
+    """
+    src_path, dest_path = copia[0], copia[1]
+    try:
+        # Reemplazar un destino existente borrándolo: si fuera un hardlink del
+        # original, escribir encima lo modificaría también
+        if os.path.lexists(dest_path):
+            os.unlink(dest_path)
+        if link_mode == 'hardlink':
+            try:
+                os.link(src_path, dest_path)
+                return None
+            except (FileExistsError, FileNotFoundError):
+                # Otro proceso creó el destino entre medio (no escribir encima) o
+                # no existe el original: ninguna otra forma de copiar funcionaría
+                raise
+            except OSError:
+                pass
+        if link_mode in ('hardlink', 'reflink') and clonar_reflink(src_path, dest_path):
+            return None
+        copiar_datos(src_path, dest_path)
+        return None
+    except Exception as e:
+        return e
@@ -0,0 +1,56 @@
+try:
+    import xlsxwriter  # Escritura de Excel en streaming
+except ImportError:
+    xlsxwriter = None
+
+def escribir_excel(df, excel_path, ancho_maximo=50, hoja='Consolidado'):
+    """
+    Escribe el DataFrame a Excel, con el ancho de cada columna ajustado al
+    texto más largo (encabezado incluido, máximo ancho_maximo).
+    Con xlsxwriter las filas se escriben en streaming (constant_memory);
+    si no está instalado se usa pandas con openpyxl.
+    
+    Args:
+        df (pd.DataFrame): Datos a escribir
+        excel_path (str): Ruta del archivo .xlsx
+        ancho_maximo (int): Ancho máximo de columna
+        hoja (str): Nombre de la hoja
+    """
+    # Calculado con pandas, sin recorrer celda por celda (columnas vacías: NaN -> 0)
+    anchos = [min(max(len(str(columna)),
+                      int(df[columna].astype(str).str.len().fillna(0).max()) if len(df) else 0) + 2,
+                  ancho_maximo)
+              for columna in df.columns]
+    
+    if xlsxwriter is None:
+        import pandas as pd
+        from openpyxl.utils import get_column_letter
+        
+        with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
+            df.to_excel(writer, sheet_name=hoja, index=False)
+            worksheet = writer.sheets[hoja]
+            for idx, ancho in enumerate(anchos, start=1):
+                worksheet.column_dimensions[get_column_letter(idx)].width = ancho
+        return
+    
+    # Se escribe fila por fila con Workbook directamente: pandas escribe por
+    # columnas, lo que no sirve con constant_memory. Las celdas vacías (NaN/NaT)
+    # se escriben en blanco, como lo hace pandas
+    valores = df.astype(object).where(df.notna(), None)
+    workbook = xlsxwriter.Workbook(excel_path, {'constant_memory': True,
+                                                'strings_to_formulas': False,
+                                                'strings_to_urls': False,
+                                                'default_date_format': 'yyyy-mm-dd hh:mm:ss'})
+    try:
+        worksheet = workbook.add_worksheet(hoja)
+        formato_encabezado = workbook.add_format({'bold': True, 'border': 1,
+                                                  'align': 'center', 'valign': 'top'})
+        
+        for idx, ancho in enumerate(anchos):
+            worksheet.set_column(idx, idx, ancho)
+        
+        worksheet.write_row(0, 0, [str(columna) for columna in df.columns], formato_encabezado)
+        for fila, registro in enumerate(valores.itertuples(index=False, name=None), start=1):
+            worksheet.write_row(fila, 0, registro)
+    finally:
+        workbook.close()
@@ -1,11 +1,83 @@
 import csv
 import re
 import unicodedata
+from dataclasses import dataclass, field, fields
 from pathlib import Path
 from PIL import Image
 import pytesseract
+from pytesseract import Output
 import os
 
+# EasyOCR es opcional: solo se usa para OCR por lotes en GPU
+try:
+    import easyocr
+except ImportError:
+    easyocr = None
+
+# Regiones (izquierda, arriba, derecha, abajo) en píxeles; None = hasta el borde de la imagen
+REGION_Q1 = (0, 0, 515, 190)
+REGION_Q2 = (1154, 0, None, 174)
+
+_PUNTOS_GUIONES_RE = re.compile(r'[.-]')
+_COMA_DOS_PUNTOS_A_PUNTO = str.maketrans(',:', '..')
+
+# Palabras clave -> código, en orden de prioridad
+_ESTADOS = {
+    "VIGENTE": "1",
+    "PENDIENTE": "2",
+    "ACTUALIZADO": "3",
+    "NULO": "4",
+}
+_TIPOS_DOCUMENTO = {
+    "EGRESO": "1",    # egreso = 1
+    "TRASPASO": "2",  # traspaso = 2
+    "INGRESO": "3",   # ingreso = 3
+    "VOUCHER": "4",   # voucher = 4
+}
+_ESTADO_RE = re.compile("|".join(_ESTADOS))
+_TIPO_DOCUMENTO_RE = re.compile("|".join(_TIPOS_DOCUMENTO))
+
+@dataclass(slots=True)
+class FilaDocumento:
+    """Fila del CSV de un documento; las columnas no conocidas se conservan en extras"""
+    numero_hoja: str = ''
+    nombre_img: str = ''
+    path_img: str = ''
+    folio: str = ''
+    q1: str = ''
+    q2: str = ''
+    rut: str = ''
+    fecha: str = ''
+    nombre: str = ''
+    estado: str = ''
+    tipo_documento: str = ''
+    nota: str = ''
+    ocultar: str = 'NO'
+    procesado_ocr: str = ''  # 'SI' cuando la página ya pasó por el OCR
+    extras: dict = field(default_factory=dict)
+
+    @classmethod
+    def desde_csv(cls, fila: dict) -> "FilaDocumento":
+        """Crea la fila desde un dict de csv.DictReader"""
+        campos = {}
+        extras = {}
+        for k, v in fila.items():
+            if k is None:  # valores sobrantes de una fila mal formada
+                continue
+            if k in _CAMPOS_FILA:
+                campos[k] = v if v is not None else ''
+            else:
+                extras[k] = v
+        return cls(**campos, extras=extras)
+
+    def a_csv(self) -> dict:
+        """Convierte la fila a dict para csv.DictWriter"""
+        fila = {campo: getattr(self, campo) for campo in _CAMPOS_FILA}
+        fila.update(self.extras)
+        return fila
+
+_CAMPOS_FILA = tuple(f.name for f in fields(FilaDocumento) if f.name != 'extras')
+
 def normalize_text(s: str) -> str:
     """Normaliza texto para búsqueda insensible a acentos y mayúsculas"""
     s = s.lower()
@@ -27,12 +99,30 @@ def clamp(val, lo, hi):
     """Limita un valor entre un mínimo y máximo"""
     return max(lo, min(val, hi))
 
-def ocr_text_from_region(jpg_path: Path, box: tuple[int, int, int, int]) -> str:
-    """Extrae texto OCR de una región específica de la imagen"""
+def abrir_imagen_gris(jpg_path: Path) -> Image.Image:
+    """
+    Abre la imagen en escala de grises para OCR (Tesseract binariza en gris de todos modos)
+    En JPEG, draft() hace que el decodificador entregue solo la luminancia, sin pasar por RGB
+    """
+    img = Image.open(jpg_path)
+    # Se pide el tamaño original para que no haya submuestreo y las coordenadas se mantengan
+    img.draft("L", img.size)
+    if img.mode != "L":
+        img = img.convert("L")
+    return img
+
+def ocr_text_from_region(jpg_path: Path, box: tuple[int, int, int | None, int | None]) -> str:
+    """
+    Extrae texto OCR de una región específica de la imagen
+    Un borde derecho/inferior None significa "hasta el borde de la imagen"
+    """
     try:
-        img = Image.open(jpg_path).convert("RGB")
+        # La imagen se decodifica de forma diferida: el tamaño sale de los metadatos
+        img = abrir_imagen_gris(jpg_path)
         W, H = img.size
         l, t, r, b = box
+        r = W if r is None else r
+        b = H if b is None else b
         l, t = clamp(l, 0, W), clamp(t, 0, H)
         r, b = clamp(r, 0, W), clamp(b, 0, H)
         if r <= l or b <= t:
@@ -44,6 +134,62 @@ def ocr_text_from_region(jpg_path: Path, box: tuple[int, int, int, int]) -> str:
         print(f"Error en OCR de región: {e}")
         return ""
 
+def ocr_datos_pagina(img: Image.Image) -> dict:
+    """OCR de la página completa con posición de cada palabra (pytesseract.image_to_data)"""
+    return pytesseract.image_to_data(img, lang="spa+eng", output_type=Output.DICT)
+
+def texto_desde_datos_ocr(datos: dict, box: tuple[int, int, int | None, int | None] | None = None) -> str:
+    """
+    Reconstruye el texto desde el resultado de image_to_data, en orden de lectura
+    Sin box devuelve la página completa con una línea por renglón detectado;
+    con box devuelve solo las palabras que tocan la región, separadas por un espacio
+    """
+    if box is not None:
+        l, t, r, b = box
+        r = float('inf') if r is None else r
+        b = float('inf') if b is None else b
+
+    lineas = []
+    linea_actual = None
+    for k, palabra in enumerate(datos['text']):
+        palabra = palabra.strip()
+        if not palabra:
+            continue
+        if box is not None:
+            izq, arriba = datos['left'][k], datos['top'][k]
+            der, abajo = izq + datos['width'][k], arriba + datos['height'][k]
+            if der <= l or izq >= r or abajo <= t or arriba >= b:
+                continue
+        clave = (datos['block_num'][k], datos['par_num'][k], datos['line_num'][k])
+        if clave != linea_actual:
+            lineas.append([])
+            linea_actual = clave
+        lineas[-1].append(palabra)
+
+    separador = " " if box is not None else "\n"
+    return separador.join(" ".join(linea) for linea in lineas)
+
+_lector_easyocr = None
+
+def obtener_lector_easyocr():
+    """Crea una sola vez el lector de EasyOCR (carga los modelos en GPU)"""
+    global _lector_easyocr
+    if _lector_easyocr is None:
+        _lector_easyocr = easyocr.Reader(['es', 'en'], gpu=True, cudnn_benchmark=True)
+    return _lector_easyocr
+
+def ocr_paginas_gpu(img_paths: list[Path], n_width: int = 1600, n_height: int = 2200,
+                    batch_size: int = 16) -> list[str]:
+    """
+    OCR de páginas completas por lotes en GPU con EasyOCR
+    Todas las imágenes se redimensionan a (n_width, n_height) para poder agruparlas en lotes
+    Devuelve el texto de cada página en el mismo orden que img_paths
+    """
+    lector = obtener_lector_easyocr()
+    resultados = lector.readtext_batched([str(p) for p in img_paths], n_width=n_width, n_height=n_height,
+                                         batch_size=batch_size, detail=0, paragraph=True)
+    return ["\n".join(textos) for textos in resultados]
+
 def extract_rut_from_text(text: str) -> str:
     """
     Extrae el primer RUT del texto con varios formatos posibles:
@@ -59,8 +205,11 @@ def extract_rut_from_text(text: str) -> str:
     if tiene_comas or tiene_dos_puntos:
         print(f"  🔍 RUT: Detectados caracteres problemáticos - Comas: {tiene_comas}, Dos puntos: {tiene_dos_puntos}")
     
-    # Normalizar texto: reemplazar , y : por . para estandarizar
-    text_normalizado = text.replace(',', '.').replace(':', '.')
+    # Normalizar texto: reemplazar , y : por . para estandarizar (una sola pasada)
+    if tiene_comas or tiene_dos_puntos:
+        text_normalizado = text.translate(_COMA_DOS_PUNTOS_A_PUNTO)
+    else:
+        text_normalizado = text
     
     # Patrones para diferentes formatos de RUT (ahora con texto normalizado)
     patterns = [
@@ -109,18 +258,17 @@ def extract_nombre_from_q1(text: str, rut: str) -> str:
     """
     if not text or not rut:
         return ""
-    
-    # Buscar la posición del RUT en el texto
-    rut_pos = text.upper().find(rut.upper())
+
+    # Buscar la posición del RUT en el texto sin crear una copia en mayúsculas
+    # (la posición queda además en el texto original aunque upper() cambie largos)
+    match = re.search(re.escape(rut), text, re.IGNORECASE)
+    rut_pos = match.start() if match else -1
     if rut_pos == -1:
-        # Si no encuentra el RUT exacto, buscar por patrones similares
-        # Quitar puntos y guiones para búsqueda flexible
-        clean_rut = re.sub(r'[.-]', '', rut)
-        for i in range(len(text) - len(clean_rut) + 1):
-            text_segment = re.sub(r'[.-]', '', text[i:i+len(clean_rut)])
-            if text_segment == clean_rut:
-                rut_pos = i
-                break
+        # Si no encuentra el RUT exacto, buscar el RUT sin puntos ni guiones.
+        # Una ventana del largo del RUT limpio solo coincide si no contiene . ni -,
+        # así que basta con una búsqueda directa
+        clean_rut = _PUNTOS_GUIONES_RE.sub('', rut)
+        rut_pos = text.find(clean_rut)
     
     if rut_pos > 0:
         nombre = text[:rut_pos].strip()
@@ -156,27 +304,26 @@ def extract_fecha_from_text(text: str) -> str:
     
     return ""
 
-def extract_estado_from_text(text: str) -> str:
+def extract_estado_from_text(text: str, text_upper: str | None = None) -> str:
     """
     Extrae estado del texto Q2 y devuelve el código numérico como string
+    Si hay varios estados en el texto, gana el de mayor prioridad (orden de _ESTADOS)
     """
     if not text:
         return ""  # Vacío por defecto
     
-    text_normalized = text.upper()
+    if text_upper is None:
+        text_upper = text.upper()
     
-    if "VIGENTE" in text_normalized:
-        return "1"
-    elif "PENDIENTE" in text_normalized:
-        return "2"
-    elif "ACTUALIZADO" in text_normalized:
-        return "3"
-    elif "NULO" in text_normalized:
-        return "4"
+    # Una sola pasada sobre el texto para encontrar todos los estados presentes
+    encontrados = set(_ESTADO_RE.findall(text_upper))
+    for palabra, codigo in _ESTADOS.items():
+        if palabra in encontrados:
+            return codigo
     
     return ""  # Vacío si no se encuentra ningún estado
 
-def extract_tipo_documento_from_text(text: str) -> str:
+def extract_tipo_documento_from_text(text: str, text_upper: str | None = None) -> str:
     """
     Extrae tipo de documento del texto completo buscando la primera palabra clave encontrada
     Devuelve: "1" para egreso, "2" para traspaso, "3" para ingreso, "4" para voucher, "" si no encuentra nada
@@ -185,48 +332,34 @@ def extract_tipo_documento_from_text(text: str) -> str:
         print("  🔍 Tipo Doc: Texto vacío - No se puede detectar tipo")
         return ""  # Vacío por defecto
     
-    text_normalized = text.upper()
-    print(f"  🔍 Tipo Doc: Analizando texto (primeros 100 chars): {text_normalized[:100]}...")
-    
-    # Buscar palabras clave en orden de aparición en el texto
-    palabras_clave = [
-        ("EGRESO", "1"),   # egreso = 1
-        ("TRASPASO", "2"), # traspaso = 2  
-        ("INGRESO", "3"),  # ingreso = 3
-        ("VOUCHER", "4")   # voucher = 4
-    ]
-    
-    # Encontrar la primera palabra que aparece en el texto
-    primera_posicion = len(text_normalized)
-    tipo_encontrado = ""
-    palabra_encontrada = ""
-    
-    print("  🔍 Tipo Doc: Buscando palabras clave...")
-    
-    for palabra, codigo in palabras_clave:
-        posicion = text_normalized.find(palabra)
-        if posicion != -1:
-            print(f"  ✅ Tipo Doc: Encontrada '{palabra}' en posición {posicion}")
-            if posicion < primera_posicion:
-                primera_posicion = posicion
-                tipo_encontrado = codigo
-                palabra_encontrada = palabra
-                print(f"  🎯 Tipo Doc: '{palabra}' es la primera palabra encontrada (posición {posicion})")
-        else:
-            print(f"  ❌ Tipo Doc: No se encontró '{palabra}'")
+    if text_upper is None:
+        text_upper = text.upper()
+    print(f"  🔍 Tipo Doc: Analizando texto (primeros 100 chars): {text_upper[:100]}...")
     
-    if tipo_encontrado:
-        print(f"  ✅ Tipo Doc: RESULTADO FINAL -> '{palabra_encontrada}' = código '{tipo_encontrado}'")
-    else:
-        print("  ❌ Tipo Doc: RESULTADO FINAL -> No se encontró ningún tipo de documento")
+    # La alternativa compilada devuelve la palabra clave que aparece primero en el texto
+    match = _TIPO_DOCUMENTO_RE.search(text_upper)
+    if match:
+        palabra_encontrada = match.group(0)
+        tipo_encontrado = _TIPOS_DOCUMENTO[palabra_encontrada]
+        print(f"  ✅ Tipo Doc: RESULTADO FINAL -> '{palabra_encontrada}' = código '{tipo_encontrado}' (posición {match.start()})")
+        return tipo_encontrado  # Devuelve "1", "2", "3" o "4"
     
-    return tipo_encontrado  # Devuelve "1", "2", "3", "4" o ""
+    print("  ❌ Tipo Doc: RESULTADO FINAL -> No se encontró ningún tipo de documento")
+    return ""
 
-def process_document_ocr(doc_name: str) -> bool:
+def process_document_ocr(doc_name: str, force: bool = False, use_gpu: bool = False,
+                         gpu_batch_size: int = 16) -> bool:
     """
     Procesa un documento para extraer datos con OCR
-    Lee el CSV existente y añade/actualiza columnas: folio, q1, q2, rut, fecha, nombre, estado, tipo_documento, nota
-    Actualiza el CSV después de procesar cada imagen
+    Lee el CSV existente y añade/actualiza columnas: folio, q1, q2, rut, fecha, nombre, estado, tipo_documento,
+    nota, procesado_ocr
+    Cada fila procesada se escribe de inmediato en un CSV temporal que reemplaza al original al terminar
+    
+    Las filas marcadas con procesado_ocr='SI' (o que ya tienen folio o q1) no se vuelven a procesar, y si quedó un CSV temporal
+    de una extracción interrumpida se retoma desde ahí. Con force=True se procesa todo de nuevo.
+    
+    Con use_gpu=True (y EasyOCR instalado) el OCR de página completa se hace por lotes en GPU;
+    el OCR de las regiones q1/q2 y el análisis del texto siguen igual.
     """
     try:
         doc_folder = Path('documentos') / doc_name
@@ -245,129 +378,190 @@ def process_document_ocr(doc_name: str) -> bool:
         with open(csv_path, 'r', encoding='utf-8') as f:
             reader = csv.DictReader(f)
             fieldnames = list(reader.fieldnames)
-            rows = list(reader)
+            rows = [FilaDocumento.desde_csv(fila) for fila in reader]
         
         # Verificar si ya tiene las columnas de OCR y añadirlas si no existen
         new_columns = []
-        for col in ['folio', 'q1', 'q2', 'rut', 'fecha', 'nombre', 'estado', 'tipo_documento', 'nota', 'ocultar']:
+        for col in ['folio', 'q1', 'q2', 'rut', 'fecha', 'nombre', 'estado', 'tipo_documento', 'nota', 'ocultar',
+                    'procesado_ocr']:
             if col not in fieldnames:
                 new_columns.append(col)
         
         # Actualizar fieldnames
         updated_fieldnames = fieldnames + new_columns
         
-        # Procesar cada fila/imagen
-        for i, row in enumerate(rows):
-            img_name = row.get('nombre_img', '')
-            img_path = images_folder / img_name
+        # Las filas se escriben a un CSV temporal a medida que se procesan, y al
+        # terminar reemplaza al original: el CSV original queda intacto si el
+        # proceso se interrumpe, y cada fila se escribe una sola vez
+        tmp_csv_path = csv_path.with_suffix('.csv.new')
+        
+        # Retomar una extracción interrumpida: las filas completas del CSV temporal ya fueron procesadas
+        filas_retomadas = 0
+        if not force and tmp_csv_path.exists():
+            with open(tmp_csv_path, 'r', encoding='utf-8') as f:
+                for i, fila in enumerate(csv.DictReader(f)):
+                    if (i >= len(rows) or None in fila.values()
+                            or fila.get('nombre_img') != rows[i].nombre_img):
+                        break
+                    rows[i] = FilaDocumento.desde_csv(fila)
+                    filas_retomadas += 1
+            if filas_retomadas:
+                print(f"⏩ Retomando extracción: {filas_retomadas} filas ya procesadas")
+        
+        # Filas ya procesadas en una ejecución anterior. Los CSV anteriores a la
+        # columna procesado_ocr se deciden fila por fila: solo cuenta como hecha la
+        # que tiene su propio folio o q1. Para volver a procesarlas, force=True
+        saltar = [not force and bool(i < filas_retomadas or row.procesado_ocr == 'SI'
+                                     or row.folio or row.q1)
+                  for i, row in enumerate(rows)]
+        
+        if use_gpu and easyocr is None:
+            print("⚠️  EasyOCR no está instalado, se usa Tesseract")
+            use_gpu = False
+        
+        # Con GPU, las páginas pendientes se envían en lotes a medida que el loop las necesita
+        pendientes_gpu = []
+        textos_gpu = {}
+        if use_gpu:
+            pendientes_gpu = [i for i, row in enumerate(rows)
+                              if not saltar[i] and (images_folder / row.nombre_img).exists()]
+        
+        with open(tmp_csv_path, 'w', newline='', encoding='utf-8') as writer_fh:
+            writer = csv.DictWriter(writer_fh, fieldnames=updated_fieldnames, extrasaction='ignore')
+            writer.writeheader()
             
-            if img_path.exists():
-                print(f"\n🔄 Procesando {img_name} ({i+1}/{len(rows)})...")
-                
-                # OCR página completa
-                try:
-                    ocr_page_text = pytesseract.image_to_string(Image.open(img_path), lang="spa+eng")
-                    print(f"  📖 OCR completo obtenido: {len(ocr_page_text)} caracteres")
-                    if ocr_page_text:
-                        print(f"  📖 OCR inicio: {ocr_page_text[:200]}...")
-                    else:
-                        print("  ⚠️  OCR devolvió texto vacío")
-                except Exception as e:
-                    print(f"  ❌ Error de OCR en {img_name}: {e}")
-                    ocr_page_text = ""
-                
-                # Extraer folio si contiene comprobante
-                has_comp = contains_comprobante(ocr_page_text)
-                folio = extract_first_folio_token(ocr_page_text) if has_comp else ""
-                print(f"  📋 Contiene comprobante: {'SÍ' if has_comp else 'NO'}")
-                if folio:
-                    print(f"  📋 Folio detectado: {folio}")
-                else:
-                    print("  📋 No se detectó folio")
+            # Procesar cada fila/imagen
+            for i, row in enumerate(rows):
+                img_name = row.nombre_img
+                img_path = images_folder / img_name
                 
-                # Extraer tipo de documento desde el OCR completo
-                print(f"\n  🔍 === ANÁLISIS TIPO DE DOCUMENTO ===")
-                tipo_documento = extract_tipo_documento_from_text(ocr_page_text)
-                print(f"  🔍 === FIN ANÁLISIS TIPO DE DOCUMENTO ===\n")
+                # Saltar filas ya procesadas en una ejecución anterior
+                if saltar[i]:
+                    writer.writerow(row.a_csv())
+                    continue
                 
-                # Solo extraer q1 y q2 si se encontró folio
-                q1_text = ""
-                q2_text = ""
-                rut = ""
-                fecha = ""
-                nombre = ""
-                estado = ""  # Default vacío
-                
-                if folio:
-                    print(f"  🔍 Extrayendo Q1 y Q2 porque se encontró folio...")
-                    q1_text = ocr_text_from_region(img_path, (0, 0, 515, 190))
-                    q2_text = ocr_text_from_region(img_path, (1154, 0, 10**9, 174))
+                if img_path.exists():
+                    print(f"\n🔄 Procesando {img_name} ({i+1}/{len(rows)})...")
                     
-                    # Extraer RUT, fecha y nombre
-                    rut = extract_rut_from_text(q1_text)
-                    fecha = extract_fecha_from_text(q2_text)
-                    nombre = extract_nombre_from_q1(q1_text, rut)
+                    # OCR página completa. Con Tesseract se guarda la posición de cada palabra
+                    # para sacar q1/q2 de la misma pasada, sin volver a hacer OCR de las regiones
+                    datos_ocr = None
+                    try:
+                        if use_gpu:
+                            if i not in textos_gpu:
+                                inicio = pendientes_gpu.index(i)
+                                lote = pendientes_gpu[inicio:inicio + gpu_batch_size]
+                                print(f"  🚀 OCR en GPU de {len(lote)} páginas...")
+                                textos = ocr_paginas_gpu([images_folder / rows[j].nombre_img for j in lote],
+                                                         batch_size=gpu_batch_size)
+                                textos_gpu.update(zip(lote, textos))
+                            ocr_page_text = textos_gpu.pop(i)
+                        else:
+                            datos_ocr = ocr_datos_pagina(abrir_imagen_gris(img_path))
+                            ocr_page_text = texto_desde_datos_ocr(datos_ocr)
+                        print(f"  📖 OCR completo obtenido: {len(ocr_page_text)} caracteres")
+                        if ocr_page_text:
+                            print(f"  📖 OCR inicio: {ocr_page_text[:200]}...")
+                        else:
+                            print("  ⚠️  OCR devolvió texto vacío")
+                    except Exception as e:
+                        print(f"  ❌ Error de OCR en {img_name}: {e}")
+                        ocr_page_text = ""
                     
-                    # Extraer estado del Q2
-                    estado = extract_estado_from_text(q2_text)
+                    # Extraer folio si contiene comprobante
+                    has_comp = contains_comprobante(ocr_page_text)
+                    folio = extract_first_folio_token(ocr_page_text) if has_comp else ""
+                    print(f"  📋 Contiene comprobante: {'SÍ' if has_comp else 'NO'}")
+                    if folio:
+                        print(f"  📋 Folio detectado: {folio}")
+                    else:
+                        print("  📋 No se detectó folio")
                     
-                    print(f"  🔍 Datos extraídos de cuadrantes:")
-                    print(f"    Q1 longitud: {len(q1_text)} chars")
-                    print(f"    Q2 longitud: {len(q2_text)} chars")
-                else:
-                    print(f"  ⚠️  No se extraen Q1/Q2 porque no hay folio")
-                
-                # Mostrar valor anterior vs nuevo para tipo_documento
-                valor_anterior = row.get('tipo_documento', '')
-                print(f"  📊 Tipo documento - Anterior: '{valor_anterior}' | Detectado: '{tipo_documento}'")
-                
-                # Actualizar/sobrescribir valores en el row
-                row['folio'] = folio
-                row['q1'] = q1_text
-                row['q2'] = q2_text
-                row['rut'] = rut
-                row['fecha'] = fecha
-                row['nombre'] = nombre
-                row['estado'] = row.get('estado', estado)  # Mantener valor existente o usar el extraído
-                row['tipo_documento'] = tipo_documento  # Siempre usar el valor detectado
-                row['nota'] = row.get('nota', '')  # Mantener nota existente o vacío
-                row['ocultar'] = row.get('ocultar', 'NO')  # Mantener valor existente o NO por defecto
-                
-                # Mostrar resumen final
-                print(f"  📊 === RESUMEN FINAL ===")
-                if folio:
-                    print(f"  ✅ Folio: {folio}")
-                    print(f"  🆔 RUT: {rut}")
-                    print(f"  📅 Fecha: {fecha}")
-                    print(f"  👤 Nombre: {nombre[:50]}{'...' if len(nombre)>50 else ''}")
-                    print(f"  📊 Estado: {estado}")
-                print(f"  📄 Tipo Doc FINAL: '{row['tipo_documento']}'")
-                if q1_text:
-                    print(f"  Q1: {q1_text[:30]}{'...' if len(q1_text)>30 else ''}")
-                if q2_text:
-                    print(f"  Q2: {q2_text[:30]}{'...' if len(q2_text)>30 else ''}")
-                print(f"  📊 === FIN RESUMEN ===")
-                
-                # Escribir CSV actualizado después de cada imagen
-                with open(csv_path, 'w', newline='', encoding='utf-8') as f:
-                    writer = csv.DictWriter(f, fieldnames=updated_fieldnames)
-                    writer.writeheader()
-                    writer.writerows(rows)
-                
-                print(f"  💾 CSV actualizado")
-                
-            else:
-                print(f"⚠️  Advertencia: Imagen {img_name} no encontrada")
-                # Añadir valores vacíos
-                for col in ['folio', 'q1', 'q2', 'rut', 'fecha', 'nombre', 'estado', 'tipo_documento', 'nota']:
-                    row[col] = ""
-                row['ocultar'] = row.get('ocultar', 'NO')  # Mantener valor existente
+                    # Extraer tipo de documento desde el OCR completo
+                    print(f"\n  🔍 === ANÁLISIS TIPO DE DOCUMENTO ===")
+                    tipo_documento = extract_tipo_documento_from_text(ocr_page_text, text_upper=ocr_page_text.upper())
+                    print(f"  🔍 === FIN ANÁLISIS TIPO DE DOCUMENTO ===\n")
+                    
+                    # Solo extraer q1 y q2 si se encontró folio
+                    q1_text = ""
+                    q2_text = ""
+                    rut = ""
+                    fecha = ""
+                    nombre = ""
+                    estado = ""  # Default vacío
+                    
+                    if folio:
+                        print(f"  🔍 Extrayendo Q1 y Q2 porque se encontró folio...")
+                        if datos_ocr is not None:
+                            q1_text = texto_desde_datos_ocr(datos_ocr, REGION_Q1)
+                            q2_text = texto_desde_datos_ocr(datos_ocr, REGION_Q2)
+                        else:
+                            q1_text = ocr_text_from_region(img_path, REGION_Q1)
+                            q2_text = ocr_text_from_region(img_path, REGION_Q2)
+                        
+                        # Extraer RUT, fecha y nombre
+                        rut = extract_rut_from_text(q1_text)
+                        fecha = extract_fecha_from_text(q2_text)
+                        nombre = extract_nombre_from_q1(q1_text, rut)
+                        
+                        # Extraer estado del Q2
+                        estado = extract_estado_from_text(q2_text, text_upper=q2_text.upper())
+                        
+                        print(f"  🔍 Datos extraídos de cuadrantes:")
+                        print(f"    Q1 longitud: {len(q1_text)} chars")
+                        print(f"    Q2 longitud: {len(q2_text)} chars")
+                    else:
+                        print(f"  ⚠️  No se extraen Q1/Q2 porque no hay folio")
+                    
+                    # Mostrar valor anterior vs nuevo para tipo_documento
+                    valor_anterior = row.tipo_documento
+                    print(f"  📊 Tipo documento - Anterior: '{valor_anterior}' | Detectado: '{tipo_documento}'")
+                    
+                    # Actualizar/sobrescribir valores en el row
+                    # (nota y ocultar mantienen su valor existente o el valor por defecto)
+                    row.folio = folio
+                    row.q1 = q1_text
+                    row.q2 = q2_text
+                    row.rut = rut
+                    row.fecha = fecha
+                    row.nombre = nombre
+                    if 'estado' not in fieldnames:
+                        row.estado = estado  # Mantener valor existente o usar el extraído
+                    row.tipo_documento = tipo_documento  # Siempre usar el valor detectado
+                    row.procesado_ocr = 'SI'
+                    
+                    # Mostrar resumen final
+                    print(f"  📊 === RESUMEN FINAL ===")
+                    if folio:
+                        print(f"  ✅ Folio: {folio}")
+                        print(f"  🆔 RUT: {rut}")
+                        print(f"  📅 Fecha: {fecha}")
+                        print(f"  👤 Nombre: {nombre[:50]}{'...' if len(nombre)>50 else ''}")
+                        print(f"  📊 Estado: {estado}")
+                    print(f"  📄 Tipo Doc FINAL: '{row.tipo_documento}'")
+                    if q1_text:
+                        print(f"  Q1: {q1_text[:30]}{'...' if len(q1_text)>30 else ''}")
+                    if q2_text:
+                        print(f"  Q2: {q2_text[:30]}{'...' if len(q2_text)>30 else ''}")
+                    print(f"  📊 === FIN RESUMEN ===")
+                    
+                    # Escribir solo esta fila en el CSV temporal
+                    writer.writerow(row.a_csv())
+                    writer_fh.flush()
+                    
+                    print(f"  💾 Fila guardada")
                 
-                # Escribir CSV también para imágenes no encontradas
-                with open(csv_path, 'w', newline='', encoding='utf-8') as f:
-                    writer = csv.DictWriter(f, fieldnames=updated_fieldnames)
-                    writer.writeheader()
-                    writer.writerows(rows)
+                else:
+                    print(f"⚠️  Advertencia: Imagen {img_name} no encontrada")
+                    # Añadir valores vacíos (ocultar mantiene su valor existente)
+                    for col in ['folio', 'q1', 'q2', 'rut', 'fecha', 'nombre', 'estado', 'tipo_documento', 'nota']:
+                        setattr(row, col, "")
+                    
+                    # Escribir la fila también para imágenes no encontradas
+                    writer.writerow(row.a_csv())
+                    writer_fh.flush()
+        
+        os.replace(tmp_csv_path, csv_path)
         
         print(f"\n🎉 ✅ Extracción completada para {doc_name}")
         print(f"📄 CSV final: {csv_path}")
@@ -1,9 +1,10 @@
 import os
 import csv
-import pandas as pd
-import glob
-import shutil
+import mmap
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime
+from functools import partial
 
 try:
     import pymupdf as fitz  # Importación moderna de PyMuPDF
@@ -14,20 +15,39 @@ except ImportError:
         print("❌ PyMuPDF no está instalado")
         fitz = None
 
-from PIL import Image
+# Función para abrir PDFs, resuelta una vez al importar (versiones antiguas solo tienen Document)
+abrir_pdf = (getattr(fitz, 'open', None) or getattr(fitz, 'Document', None)) if fitz else None
+
 from pathlib import Path
 
-def save_jpg_from_pixmap(pix, out_path, quality=90):
-    """
-    Guarda un pixmap de PyMuPDF como JPG
-    """
-    # Convertir a RGB si tiene canal alpha
-    if pix.alpha:
-        pix = fitz.Pixmap(fitz.csRGB, pix)
-    
-    # Convertir a PIL Image y guardar
-    img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-    img.save(out_path, format="JPEG", quality=quality, optimize=True)
+import numpy as np
+from PIL import Image
+
+try:
+    # libjpeg-turbo (SIMD) para codificar las páginas; necesita la librería del sistema
+    from turbojpeg import TurboJPEG, TJPF_GRAY, TJPF_RGB, TJSAMP_420, TJSAMP_GRAY
+    _turbo_jpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    _turbo_jpeg = None
+
+try:
+    # libjpeg-turbo empaquetado en la rueda, sin librería del sistema
+    import simplejpeg
+except ImportError:
+    simplejpeg = None
+
+try:
+    import fcntl  # Solo en Linux/Unix, para bloquear el contador de entregables
+except ImportError:
+    fcntl = None
+
+try:
+    from functions.archivos import copiar_pdf
+    from functions.excel import escribir_excel
+except ImportError:
+    # Importado con functions/ en sys.path (como los scripts de esa carpeta)
+    from archivos import copiar_pdf
+    from excel import escribir_excel
 
 def ensure_dir(path):
     """
@@ -35,13 +55,185 @@ def ensure_dir(path):
     """
     path.mkdir(parents=True, exist_ok=True)
 
-def process_pdf_to_images_and_csv(pdf_path, pdf_name):
+# Páginas acumuladas antes de cada escritura al CSV
+CSV_BATCH_ROWS = 64
+
+# Documento, matriz y espacio de color de cada proceso de render (ver _iniciar_worker_render)
+_doc_worker = None
+_get_page_worker = None
+_mat_worker = None
+_colorspace_worker = None
+
+def _abrir_pdf_mapeado(pdf_path):
+    """
+    Abre el PDF sobre un mmap del archivo: el sistema operativo carga desde la
+    caché de páginas solo lo que se va leyendo, sin copias en Python.
+    Si no se puede mapear (archivo vacío, versión de PyMuPDF sin soporte de
+    memoryview) se abre por ruta como siempre
+    """
+    try:
+        with open(pdf_path, 'rb') as f:
+            mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return abrir_pdf(pdf_path)
+    
+    try:
+        return abrir_pdf(stream=memoryview(mapa), filetype='pdf')
+    except TypeError:
+        mapa.close()
+        return abrir_pdf(pdf_path)
+
+def _cerrar_pdf(doc):
+    """Cierra el documento y libera el mmap del archivo si se abrió con uno"""
+    vista = getattr(doc, 'stream', None)
+    doc.close()
+    if isinstance(vista, memoryview) and isinstance(vista.obj, mmap.mmap):
+        mapa = vista.obj
+        vista.release()
+        mapa.close()
+
+def _cargador_de_paginas(doc):
+    """
+    Devuelve la función para cargar una página del documento. Se prueba una
+    sola vez si el documento admite indexing directo; si no, se usa load_page
+    """
+    try:
+        doc[0]  # Indexing directo
+        return doc.__getitem__
+    except Exception:
+        return doc.load_page  # Método tradicional
+
+def _iniciar_worker_render(pdf_path, scale, grayscale):
+    """
+    Inicializador de cada proceso del pool: abre su propia copia del PDF,
+    porque un documento de PyMuPDF no se puede compartir entre procesos
+    """
+    global _doc_worker, _get_page_worker, _mat_worker, _colorspace_worker
+    _doc_worker = _abrir_pdf_mapeado(pdf_path)
+    _get_page_worker = _cargador_de_paginas(_doc_worker)
+    _mat_worker = fitz.Matrix(scale, scale)
+    _colorspace_worker = fitz.csGRAY if grayscale else fitz.csRGB
+
+def _guardar_jpg(pix, image_path, jpg_quality):
+    """
+    Guarda un pixmap RGB o en escala de grises como JPG. Los píxeles se leen del
+    pixmap como vista NumPy, sin copiarlos, y se codifican con libjpeg-turbo
+    (PyTurboJPEG o simplejpeg) si está disponible o con Pillow.
+    Se escribe a un archivo temporal que se renombra al terminar: un proceso
+    cortado a medio escribir no deja un JPG truncado con el nombre final
+    """
+    tmp_path = f"{os.fspath(image_path)}.tmp"
+    gris = pix.n == 1
+    pixeles = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    
+    if _turbo_jpeg is not None:
+        data = _turbo_jpeg.encode(pixeles, quality=jpg_quality,
+                                  pixel_format=TJPF_GRAY if gris else TJPF_RGB,
+                                  jpeg_subsample=TJSAMP_GRAY if gris else TJSAMP_420)
+    elif simplejpeg is not None:
+        data = simplejpeg.encode_jpeg(pixeles, quality=jpg_quality,
+                                      colorspace='GRAY' if gris else 'RGB',
+                                      colorsubsampling='Gray' if gris else '420')
+    else:
+        img = Image.fromarray(pixeles[:, :, 0] if gris else pixeles)
+        img.save(tmp_path, format="JPEG", quality=jpg_quality,
+                 optimize=False, progressive=False, subsampling=2)
+        data = None
+    
+    if data is not None:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+    os.replace(tmp_path, image_path)
+
+def _fila_csv(page_num):
+    """
+    Fila del CSV de una página
+    
+    Returns:
+        list: [numero_hoja, nombre_img, path_img, ocultar]
+    """
+    image_filename = f"{page_num:04d}.jpg"
+    
+    # Path relativo desde la carpeta del documento
+    relative_path = f"imagenes{os.sep}{image_filename}"
+    
+    return [page_num, image_filename, relative_path, 'NO']
+
+def _render_page(get_page, i, images_folder, mat, colorspace, jpg_quality):
+    """
+    Renderiza la página i del documento a JPG, cargándola con get_page.
+    images_folder es la carpeta de imágenes como str
+    
+    Returns:
+        list: Fila para el CSV [numero_hoja, nombre_img, path_img, ocultar]
+    """
+    page_num = i + 1
+    
+    # Formatear número con ceros a la izquierda (0001, 0002, etc.)
+    image_number = f"{page_num:04d}"
+    image_filename = f"{image_number}.jpg"
+    image_path = f"{images_folder}{os.sep}{image_filename}"
+    
+    # Cargar página y convertir a imagen
+    page = get_page(i)
+    pix = page.get_pixmap(matrix=mat, colorspace=colorspace, alpha=False)
+    
+    # Guardar imagen
+    _guardar_jpg(pix, image_path, jpg_quality)
+    
+    return _fila_csv(page_num)
+
+def _render_pages_pipeline(get_page, pendientes, images_folder, mat, colorspace, jpg_quality,
+                           io_threads=4, max_en_vuelo=8):
+    """
+    Renderiza las páginas en este hilo mientras hilos aparte codifican y escriben
+    los JPG de las anteriores, para que el disco no frene el render.
+    Como mucho max_en_vuelo imágenes esperan a ser escritas.
+    
+    Yields:
+        list: Fila para el CSV de cada página, en orden
+    """
+    en_vuelo = deque()
+    with ThreadPoolExecutor(max_workers=io_threads) as io_pool:
+        for i in pendientes:
+            page_num = i + 1
+            image_path = f"{images_folder}{os.sep}{page_num:04d}.jpg"
+            pix = get_page(i).get_pixmap(matrix=mat, colorspace=colorspace, alpha=False)
+            en_vuelo.append((page_num, io_pool.submit(_guardar_jpg, pix, image_path, jpg_quality)))
+            
+            if len(en_vuelo) >= max_en_vuelo:
+                page_num_lista, futuro = en_vuelo.popleft()
+                futuro.result()
+                yield _fila_csv(page_num_lista)
+        
+        while en_vuelo:
+            page_num_lista, futuro = en_vuelo.popleft()
+            futuro.result()
+            yield _fila_csv(page_num_lista)
+
+def _render_page_worker(i, images_folder, jpg_quality):
+    """Renderiza la página i con el documento abierto por este proceso"""
+    return _render_page(_get_page_worker, i, images_folder, _mat_worker, _colorspace_worker, jpg_quality)
+
+def process_pdf_to_images_and_csv(pdf_path, pdf_name, threads=None, verbose=False,
+                                  scale=2.0, jpg_quality=90, force=False, grayscale=False):
     """
     Procesa un PDF página por página, generando imágenes y actualizando CSV incrementalmente.
+    Las páginas se renderizan en paralelo en varios procesos; las filas del CSV se escriben en orden.
+    Si se vuelve a ejecutar, las páginas cuya imagen ya existe no se renderizan de nuevo
+    y las hojas que ya están en el CSV no se vuelven a agregar.
     
     Args:
         pdf_path (str): Ruta completa al archivo PDF
         pdf_name (str): Nombre del PDF sin extensión
+        threads (int): Procesos para renderizar (por defecto, uno por núcleo; 1 = sin paralelismo)
+        verbose (bool): Imprimir el progreso de cada página
+        scale (float): Escala de render (2.0 ≈ 200 DPI, 1.5 ≈ 150 DPI). Las regiones q1/q2
+            de extraer_datos están calibradas en píxeles para 2.0
+        jpg_quality (int): Calidad JPEG de las imágenes (1-100)
+        force (bool): Renderizar todas las páginas aunque su imagen ya exista
+        grayscale (bool): Renderizar en escala de grises (un tercio de los bytes por página;
+            el OCR de extraer_datos trabaja en gris de todos modos)
     
     Returns:
         bool: True si el procesamiento fue exitoso, False en caso contrario
@@ -76,8 +268,14 @@ def process_pdf_to_images_and_csv(pdf_path, pdf_name):
         # Verificar si necesitamos escribir headers
         write_header = not csv_path.exists()
         
-        # Abrir CSV en modo append
-        csv_file = open(csv_path, "a", newline="", encoding="utf-8")
+        # Hojas que ya están en el CSV de una ejecución anterior
+        paginas_en_csv = set()
+        if not write_header:
+            with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+                paginas_en_csv = {row.get('numero_hoja') for row in csv.DictReader(f)}
+        
+        # Abrir CSV en modo append (buffer de 1 MB)
+        csv_file = open(csv_path, "a", newline="", encoding="utf-8", buffering=1024 * 1024)
         csv_writer = csv.writer(csv_file)
         
         # Escribir headers si es un archivo nuevo
@@ -88,63 +286,79 @@ def process_pdf_to_images_and_csv(pdf_path, pdf_name):
         
         # 3. Abrir PDF con PyMuPDF
         print(f"📖 Abriendo PDF: {pdf_path}")
-        print(f"🔍 Verificando métodos disponibles en fitz: {[attr for attr in dir(fitz) if 'open' in attr.lower()]}")
         
-        # Intentar diferentes formas de abrir el PDF
-        try:
-            doc = fitz.open(pdf_path)
-        except AttributeError:
-            try:
-                doc = fitz.Document(pdf_path)
-            except AttributeError:
-                print("❌ No se puede encontrar método para abrir PDF en fitz")
-                return False
+        if abrir_pdf is None:
+            print("❌ No se puede encontrar método para abrir PDF en fitz")
+            return False
+        doc = _abrir_pdf_mapeado(pdf_path)
         
         n_pages = len(doc)
         print(f"📄 PDF cargado exitosamente. Total de páginas: {n_pages}")
         
-        # 4. Procesar página por página
-        for i in range(n_pages):
-            page_num = i + 1
-            
-            # Formatear número con ceros a la izquierda (0001, 0002, etc.)
-            image_number = f"{page_num:04d}"
-            image_filename = f"{image_number}.jpg"
-            image_path = images_folder / image_filename
-            
-            print(f"🔄 Procesando página {page_num}/{n_pages}: {image_filename}")
-            
-            # Cargar página y convertir a imagen
-            try:
-                page = doc[i]  # Indexing directo
-            except:
-                page = doc.load_page(i)  # Método tradicional
-            
-            # Matriz para alta calidad (~200 DPI)
-            mat = fitz.Matrix(2.0, 2.0)
-            pix = page.get_pixmap(matrix=mat, alpha=False)
-            
-            # Guardar imagen
-            print(f"💾 Guardando imagen: {image_filename}")
-            save_jpg_from_pixmap(pix, image_path)
-            
-            # Preparar datos para CSV (path relativo desde la carpeta del documento)
-            relative_path = os.path.join('imagenes', image_filename)
-            
-            # Escribir fila al CSV inmediatamente
-            csv_row = [page_num, image_filename, relative_path, 'NO']
-            csv_writer.writerow(csv_row)
-            print(f"📝 Fila agregada al CSV: Hoja {page_num} -> {image_filename}")
-            
-            # Liberar memoria del pixmap
-            pix = None
-            
-            print(f"✅ Página {page_num} completada")
+        # 4. Renderizar páginas (solo las que no tienen imagen, salvo force)
+        images_folder_str = os.fspath(images_folder)
+        if force:
+            pendientes = list(range(n_pages))
+        else:
+            # Los JPG se escriben con un temporal y os.replace: uno con el nombre
+            # final está completo
+            imagenes_existentes = {entry.name for entry in os.scandir(images_folder_str)
+                                   if entry.is_file() and entry.stat().st_size > 0}
+            pendientes = [i for i in range(n_pages) if f"{i + 1:04d}.jpg" not in imagenes_existentes]
+            if len(pendientes) < n_pages:
+                print(f"⏭️  {n_pages - len(pendientes)} páginas ya tienen imagen, se omite su render")
+        
+        workers = min(threads or os.cpu_count() or 1, len(pendientes))
+        
+        if workers > 1:
+            print(f"⚙️  Renderizando con {workers} procesos")
+            executor = ProcessPoolExecutor(max_workers=workers,
+                                           initializer=_iniciar_worker_render,
+                                           initargs=(str(pdf_path), scale, grayscale))
+            render = partial(_render_page_worker, images_folder=images_folder_str, jpg_quality=jpg_quality)
+            # Cada proceso recibe tramos contiguos de páginas (mejor uso de la caché de
+            # fuentes/recursos de su documento), varios por proceso para repartir la carga
+            chunksize = max(1, len(pendientes) // (workers * 4))
+            renderizadas = executor.map(render, pendientes, chunksize=chunksize)
+        else:
+            executor = None
+            mat = fitz.Matrix(scale, scale)
+            colorspace = fitz.csGRAY if grayscale else fitz.csRGB
+            get_page = _cargador_de_paginas(doc)
+            renderizadas = _render_pages_pipeline(get_page, pendientes, images_folder_str,
+                                                  mat, colorspace, jpg_quality)
+        
+        # Filas pendientes de escribir; se vuelcan al CSV en bloques
+        rows_buffer = []
+        
+        try:
+            # map entrega los resultados en orden de página
+            pendientes_set = set(pendientes)
+            for i in range(n_pages):
+                csv_row = next(renderizadas) if i in pendientes_set else _fila_csv(i + 1)
+                if str(csv_row[0]) in paginas_en_csv:
+                    continue
+                
+                rows_buffer.append(csv_row)
+                if verbose or csv_row[0] % 50 == 0:
+                    print(f"✅ Página {csv_row[0]}/{n_pages} completada")
+                
+                if len(rows_buffer) >= CSV_BATCH_ROWS:
+                    csv_writer.writerows(rows_buffer)
+                    if verbose:
+                        print(f"📝 {len(rows_buffer)} filas agregadas al CSV (hasta hoja {csv_row[0]})")
+                    rows_buffer.clear()
+        finally:
+            # Volcar lo renderizado aunque haya fallado una página posterior
+            if rows_buffer:
+                csv_writer.writerows(rows_buffer)
+            if executor:
+                executor.shutdown()
         
         print(f"🎉 Procesamiento completado exitosamente!")
         print(f"📋 Resumen:")
         print(f"   - Carpeta creada: {base_folder}")
-        print(f"   - Imágenes generadas: {n_pages} archivos en {images_folder}")
+        print(f"   - Imágenes generadas: {len(pendientes)} de {n_pages} archivos en {images_folder}")
         print(f"   - CSV actualizado: {csv_path}")
         
         return True
@@ -161,10 +375,52 @@ def process_pdf_to_images_and_csv(pdf_path, pdf_name):
         if csv_file:
             csv_file.close()
             print(f"🔒 Archivo CSV cerrado")
-        if doc:
-            doc.close()
+        if doc is not None:
+            _cerrar_pdf(doc)
             print(f"🔒 Documento PDF cerrado")
 
+def process_pdfs_batch(pdf_paths, batch_size=8):
+    """
+    Procesa varios PDFs a la vez, cada uno en su propio proceso (sin compartir
+    estado de PyMuPDF). Cada PDF además reparte sus páginas entre procesos solo
+    si sobran núcleos (más del doble de los PDFs en paralelo); si no, se renderiza en serie.
+    
+    Args:
+        pdf_paths (list): Rutas de los PDFs
+        batch_size (int): PDFs procesados en paralelo
+    
+    Returns:
+        dict: Resultado (True/False) por ruta de PDF
+    """
+    if not pdf_paths:
+        return {}
+    
+    # Con menos PDFs que batch_size solo se abren los procesos necesarios, y las
+    # páginas de cada PDF se reparten solo entre los núcleos que sobran
+    workers = min(batch_size, len(pdf_paths))
+    cpus = os.cpu_count() or 1
+    threads = cpus // workers if cpus > 2 * workers else 1
+    
+    resultados = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futuros = {
+            executor.submit(process_pdf_to_images_and_csv, pdf_path,
+                            get_pdf_name_without_extension(os.path.basename(pdf_path)),
+                            threads=threads): pdf_path
+            for pdf_path in pdf_paths
+        }
+        for futuro in as_completed(futuros):
+            pdf_path = futuros[futuro]
+            try:
+                resultados[pdf_path] = futuro.result()
+            except Exception as e:
+                print(f"❌ Error procesando {pdf_path}: {e}")
+                resultados[pdf_path] = False
+    
+    exitosos = sum(1 for ok in resultados.values() if ok)
+    print(f"📚 Lote terminado: {exitosos}/{len(resultados)} PDFs procesados")
+    return resultados
+
 def get_pdf_name_without_extension(filename):
     """
     Obtiene el nombre del PDF sin la extensión .pdf
@@ -177,9 +433,12 @@ def get_pdf_name_without_extension(filename):
     """
     return os.path.splitext(filename)[0]
 
-def check_pdf_dependencies():
+def check_pdf_dependencies(verbose=False):
     """
     Verifica que las dependencias necesarias estén instaladas
+    
+    Args:
+        verbose (bool): Listar además algunos métodos del módulo fitz
     """
     try:
         import pymupdf as fitz_test
@@ -192,13 +451,92 @@ def check_pdf_dependencies():
             print("✅ PyMuPDF está disponible como 'fitz'")
             if hasattr(fitz_test, 'version'):
                 print(f"✅ Versión: {fitz_test.version}")
-            print(f"🔍 Métodos disponibles: {[attr for attr in dir(fitz_test) if not attr.startswith('_')][:10]}")
+            if verbose:
+                print(f"🔍 Métodos disponibles: {[attr for attr in dir(fitz_test) if not attr.startswith('_')][:10]}")
             return True
         except ImportError:
             print("❌ Error: PyMuPDF no está instalado")
             print("   Instala con: pip install PyMuPDF")
             return False
 
+def _buscar_ultimo_entregable(base_entregables):
+    """Mayor número entre las carpetas ENTREGABLEnn existentes (0 si no hay)"""
+    with os.scandir(base_entregables) as entradas:
+        existing_folders = [e.name for e in entradas
+                            if e.name.startswith("ENTREGABLE") and e.is_dir()]
+    
+    nums = []
+    for folder in existing_folders:
+        try:
+            num = int(folder.replace("ENTREGABLE", ""))
+            nums.append(num)
+        except ValueError:
+            continue
+    return max(nums) if nums else 0
+
+def _siguiente_numero_entregable(base_entregables):
+    """
+    Reserva el número del siguiente entregable usando el contador guardado en
+    ENTREGABLES/.counter, bloqueado mientras se actualiza para que dos procesos
+    no tomen el mismo número. Si el contador no existe o está dañado se parte
+    del mayor número de las carpetas existentes.
+    
+    Returns:
+        int: Número del nuevo entregable
+    """
+    counter_path = os.path.join(base_entregables, ".counter")
+    with open(counter_path, "a+", encoding="utf-8") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.seek(0)
+            contenido = f.read().strip()
+            try:
+                ultimo = int(contenido)
+            except ValueError:
+                ultimo = _buscar_ultimo_entregable(base_entregables)
+            
+            next_num = ultimo + 1
+            # Por si se creó una carpeta a mano por encima del contador
+            while os.path.exists(os.path.join(base_entregables, f"ENTREGABLE{next_num:02d}")):
+                next_num += 1
+            
+            f.seek(0)
+            f.truncate()
+            f.write(str(next_num))
+            f.flush()
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+    return next_num
+
+# Columnas que el consolidado toma del CSV de cada documento
+COLUMNAS_CSV_DOCUMENTO = ['numero_hoja', 'nombre_img', 'path_img', 'ocultar', 'folio', 'rut',
+                          'fecha', 'nombre', 'estado', 'tipo_documento', 'nota', 'q1', 'q2']
+
+def _leer_csv_documento(csv_path):
+    """
+    Lee el CSV de un documento con csv.reader, solo con COLUMNAS_CSV_DOCUMENTO y
+    todo como texto. Como con DictReader, las líneas vacías se saltan y las filas
+    con campos de más o de menos se toleran; lo que falta queda en '' ('NO' en ocultar)
+    
+    Returns:
+        pd.DataFrame: Una columna por cada una de COLUMNAS_CSV_DOCUMENTO
+    """
+    import pandas as pd
+    
+    with open(csv_path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        encabezado = next(reader, [])
+        indices = [(encabezado.index(columna) if columna in encabezado else None,
+                    'NO' if columna == 'ocultar' else '')
+                   for columna in COLUMNAS_CSV_DOCUMENTO]
+        filas = [[row[idx] if idx is not None and idx < len(row) else default
+                  for idx, default in indices]
+                 for row in reader if row]
+    
+    return pd.DataFrame(filas, columns=COLUMNAS_CSV_DOCUMENTO, dtype=object)
+
 def generar_entregable_consolidado():
     """
     Genera un entregable consolidado manteniendo estructura año/mes/tipo pero consolidando todas las cajas
@@ -206,44 +544,41 @@ def generar_entregable_consolidado():
     Returns:
         dict: Resultado del procesamiento
     """
+    # pandas solo se necesita aquí; importarlo arriba encarecería cargar el módulo
+    # (y cada proceso de render) aunque solo se procesen PDFs
+    import pandas as pd
+    
     try:
         # Crear carpeta ENTREGABLE con numeración
         base_entregables = "ENTREGABLES"
         os.makedirs(base_entregables, exist_ok=True)
         
         # Encontrar el siguiente número disponible
-        existing_folders = [d for d in os.listdir(base_entregables) 
-                           if d.startswith("ENTREGABLE") and os.path.isdir(os.path.join(base_entregables, d))]
-        
-        next_num = 1
-        if existing_folders:
-            nums = []
-            for folder in existing_folders:
-                try:
-                    num = int(folder.replace("ENTREGABLE", ""))
-                    nums.append(num)
-                except ValueError:
-                    continue
-            if nums:
-                next_num = max(nums) + 1
+        next_num = _siguiente_numero_entregable(base_entregables)
         
         entregable_folder = os.path.join(base_entregables, f"ENTREGABLE{next_num:02d}")
         os.makedirs(entregable_folder, exist_ok=True)
         
         print(f"📁 Creando entregable: {entregable_folder}")
         
-        # Lista para recopilar todos los datos
-        consolidado_data = []
+        # DataFrames por documento, se concatenan al final
+        consolidado_frames = []
+        
+        # Índice nombre de archivo -> path relativo de los PDFs copiados al entregable
+        pdfs_entregable = {}
+        
+        # PDFs copiados por carpeta del entregable, para el resumen
+        pdfs_por_carpeta = {}
         documentos_procesados = 0
         pdfs_copiados = 0
         
         # Buscar todos los documentos procesados
         if os.path.exists('documentos'):
-            for doc_name in os.listdir('documentos'):
-                doc_path = os.path.join('documentos', doc_name)
-                if not os.path.isdir(doc_path):
-                    continue
-                
+            # scandir trae el tipo de cada entrada sin un stat extra por carpeta
+            with os.scandir('documentos') as entradas:
+                carpetas_documentos = [(e.name, e.path) for e in entradas if e.is_dir()]
+            
+            for doc_name, doc_path in carpetas_documentos:
                 csv_path = os.path.join(doc_path, f"{doc_name}.csv")
                 if not os.path.exists(csv_path):
                     continue
@@ -251,135 +586,105 @@ def generar_entregable_consolidado():
                 print(f"🔄 Procesando documento: {doc_name}")
                 documentos_procesados += 1
                 
-                # Leer CSV del documento
-                with open(csv_path, 'r', encoding='utf-8') as f:
-                    reader = csv.DictReader(f)
-                    rows = list(reader)
+                # Leer CSV del documento (todo como texto, vacíos como '')
+                df_doc = _leer_csv_documento(csv_path)
                 
                 # Buscar PDFs en la estructura organizada (pdfs_estructurados)
                 pdfs_estructurados_base = os.path.join("pdfs_estructurados", doc_name)
                 
+                # Índice nombre de archivo -> path original de este documento
+                pdfs_originales = {}
+                
                 if os.path.exists(pdfs_estructurados_base):
                     print(f"  📦 Copiando estructura de {pdfs_estructurados_base}")
                     
                     # Copiar toda la estructura manteniendo año/mes/tipo pero consolidando
-                    for root, dirs, files in os.walk(pdfs_estructurados_base):
-                        for file in files:
-                            if file.endswith('.pdf'):
-                                src_path = os.path.join(root, file)
-                                
-                                # Obtener la ruta relativa desde la base del documento
-                                relative_path = os.path.relpath(root, pdfs_estructurados_base)
-                                
-                                # Crear la misma estructura en el entregable
-                                dest_dir = os.path.join(entregable_folder, relative_path)
-                                os.makedirs(dest_dir, exist_ok=True)
-                                
-                                dest_path = os.path.join(dest_dir, file)
-                                
-                                try:
-                                    shutil.copy2(src_path, dest_path)
-                                    pdfs_copiados += 1
-                                    print(f"  ✅ Copiado: {relative_path}/{file}")
-                                except Exception as e:
-                                    print(f"  ❌ Error copiando {file}: {e}")
-                
-                # Procesar cada fila del CSV para el Excel consolidado
-                for row in rows:
-                    folio = row.get('folio', '').strip()
-                    
-                    # Buscar el PDF correspondiente en la estructura
-                    pdf_path_entregable = ""
-                    pdf_path_original = ""
-                    
-                    if folio:
-                        # Buscar en la estructura copiada
-                        for root, dirs, files in os.walk(entregable_folder):
-                            for file in files:
-                                if file == f"{folio}.pdf":
-                                    # Path relativo desde la carpeta del entregable
-                                    pdf_path_entregable = os.path.relpath(
-                                        os.path.join(root, file), 
-                                        entregable_folder
-                                    ).replace('\\', '/')
-                                    break
-                            if pdf_path_entregable:
-                                break
+                    copias = []
+                    carpetas_creadas = set()
+                    base_path = Path(pdfs_estructurados_base)
+                    for src in base_path.rglob('*.pdf'):
+                        file = src.name
+                        src_path = str(src)
+                        pdfs_originales.setdefault(file, src_path.replace('\\', '/'))
                         
-                        # Path original en pdfs_estructurados
-                        pdfs_estructurados_base = os.path.join("pdfs_estructurados", doc_name)
-                        if os.path.exists(pdfs_estructurados_base):
-                            for root, dirs, files in os.walk(pdfs_estructurados_base):
-                                for file in files:
-                                    if file == f"{folio}.pdf":
-                                        pdf_path_original = os.path.join(root, file).replace('\\', '/')
-                                        break
-                                if pdf_path_original:
-                                    break
-                    
-                    # Crear registro consolidado con toda la información
-                    registro = {
-                        'documento_origen': doc_name,
-                        'numero_hoja': row.get('numero_hoja', ''),
-                        'nombre_img': row.get('nombre_img', ''),
-                        'path_img_relativo': row.get('path_img', ''),
-                        'path_img_completo': os.path.join('documentos', doc_name, row.get('path_img', '')).replace('\\', '/'),
-                        'folio': folio,
-                        'rut': row.get('rut', ''),
-                        'fecha': row.get('fecha', ''),
-                        'nombre': row.get('nombre', ''),
-                        'estado': row.get('estado', ''),
-                        'estado_texto': obtener_estado_texto(row.get('estado', '')),
-                        'tipo_documento': row.get('tipo_documento', ''),
-                        'tipo_documento_texto': obtener_tipo_documento_texto(row.get('tipo_documento', '')),
-                        'nota': row.get('nota', ''),
-                        'ocultar': row.get('ocultar', 'NO'),
-                        'q1': row.get('q1', ''),
-                        'q2': row.get('q2', ''),
-                        'pdf_path_entregable': pdf_path_entregable,
-                        'pdf_path_original': pdf_path_original
-                    }
+                        # Obtener la ruta relativa desde la base del documento
+                        relative_path = str(src.parent.relative_to(base_path))
+                        
+                        # Crear la misma estructura en el entregable
+                        dest_dir = os.path.join(entregable_folder, relative_path)
+                        if dest_dir not in carpetas_creadas:
+                            os.makedirs(dest_dir, exist_ok=True)
+                            carpetas_creadas.add(dest_dir)
+                        
+                        dest_path = os.path.join(dest_dir, file)
+                        copias.append((src_path, dest_path, relative_path, file))
                     
-                    consolidado_data.append(registro)
+                    # Las copias son de I/O: se hacen en paralelo con hilos
+                    with ThreadPoolExecutor(max_workers=min(16, (os.cpu_count() or 1) * 4)) as executor:
+                        errores = executor.map(copiar_pdf, copias)
+                        
+                        for (src_path, dest_path, relative_path, file), error in zip(copias, errores):
+                            if error is None:
+                                pdfs_copiados += 1
+                                pdfs_por_carpeta.setdefault(relative_path, set()).add(file)
+                                # Path relativo desde la carpeta del entregable
+                                pdfs_entregable.setdefault(
+                                    file,
+                                    os.path.normpath(os.path.join(relative_path, file)).replace('\\', '/')
+                                )
+                                print(f"  ✅ Copiado: {relative_path}/{file}")
+                            else:
+                                print(f"  ❌ Error copiando {file}: {error}")
+                
+                # Paths del PDF de cada fila según su folio, desde los índices
+                folios = df_doc['folio'].str.strip()
+                nombres_pdf = folios + '.pdf'
+                pdf_path_entregable = nombres_pdf.map(pdfs_entregable).fillna('').where(folios != '', '')
+                pdf_path_original = nombres_pdf.map(pdfs_originales).fillna('').where(folios != '', '')
+                
+                # Registros consolidados del documento, armados por columnas
+                consolidado_frames.append(pd.DataFrame({
+                    'documento_origen': doc_name,
+                    'numero_hoja': df_doc['numero_hoja'],
+                    'nombre_img': df_doc['nombre_img'],
+                    'path_img_relativo': df_doc['path_img'],
+                    'path_img_completo': ('documentos/' + doc_name + '/' + df_doc['path_img']).str.replace('\\', '/', regex=False),
+                    'folio': folios,
+                    'rut': df_doc['rut'],
+                    'fecha': df_doc['fecha'],
+                    'nombre': df_doc['nombre'],
+                    'estado': df_doc['estado'],
+                    'estado_texto': df_doc['estado'].map({v: obtener_estado_texto(v) for v in df_doc['estado'].unique()}),
+                    'tipo_documento': df_doc['tipo_documento'],
+                    'tipo_documento_texto': df_doc['tipo_documento'].map({v: obtener_tipo_documento_texto(v) for v in df_doc['tipo_documento'].unique()}),
+                    'nota': df_doc['nota'],
+                    'ocultar': df_doc['ocultar'],
+                    'q1': df_doc['q1'],
+                    'q2': df_doc['q2'],
+                    'pdf_path_entregable': pdf_path_entregable,
+                    'pdf_path_original': pdf_path_original
+                }))
+        
+        consolidado = (pd.concat(consolidado_frames, ignore_index=True)
+                       if consolidado_frames else pd.DataFrame())
         
         # Crear Excel consolidado
-        if consolidado_data:
-            df = pd.DataFrame(consolidado_data)
+        if len(consolidado):
+            df = consolidado
             excel_path = os.path.join(entregable_folder, f"CONSOLIDADO_ENTREGABLE{next_num:02d}.xlsx")
             
             # Crear el Excel con formato
-            with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
-                df.to_excel(writer, sheet_name='Consolidado', index=False)
-                
-                # Obtener worksheet para formatear
-                worksheet = writer.sheets['Consolidado']
-                
-                # Ajustar ancho de columnas
-                for column in worksheet.columns:
-                    max_length = 0
-                    column_letter = column[0].column_letter
-                    for cell in column:
-                        try:
-                            if len(str(cell.value)) > max_length:
-                                max_length = len(str(cell.value))
-                        except:
-                            pass
-                    adjusted_width = min(max_length + 2, 50)
-                    worksheet.column_dimensions[column_letter].width = adjusted_width
+            escribir_excel(df, excel_path, ancho_maximo=50)
             
             print(f"📊 Excel consolidado creado: {excel_path}")
         
         # Crear archivo de resumen
         resumen_path = os.path.join(entregable_folder, "RESUMEN.txt")
         
-        # Analizar estructura creada
-        estructura_info = []
-        for root, dirs, files in os.walk(entregable_folder):
-            if files and any(f.endswith('.pdf') for f in files):
-                pdf_count = len([f for f in files if f.endswith('.pdf')])
-                relative_path = os.path.relpath(root, entregable_folder)
-                if relative_path != ".":
-                    estructura_info.append(f"  {relative_path}: {pdf_count} PDFs")
+        # Analizar estructura creada (a partir de lo copiado, sin recorrer el entregable)
+        estructura_info = [f"  {relative_path}: {len(archivos)} PDFs"
+                           for relative_path, archivos in pdfs_por_carpeta.items()
+                           if relative_path != "."]
         
         with open(resumen_path, 'w', encoding='utf-8') as f:
             f.write(f"ENTREGABLE {next_num:02d}\n")
@@ -387,7 +692,7 @@ def generar_entregable_consolidado():
             f.write(f"ESTADÍSTICAS:\n")
             f.write(f"- Documentos procesados: {documentos_procesados}\n")
             f.write(f"- PDFs copiados: {pdfs_copiados}\n")
-            f.write(f"- Registros en Excel: {len(consolidado_data)}\n\n")
+            f.write(f"- Registros en Excel: {len(consolidado)}\n\n")
             f.write(f"CONTENIDO:\n")
             f.write(f"- Estructura de carpetas por año/mes/tipo consolidada\n")
             f.write(f"- CONSOLIDADO_ENTREGABLE{next_num:02d}.xlsx: Excel maestro con todos los datos\n")
@@ -405,7 +710,7 @@ def generar_entregable_consolidado():
             'entregable_num': next_num,
             'documentos_procesados': documentos_procesados,
             'pdfs_copiados': pdfs_copiados,
-            'registros_excel': len(consolidado_data),
+            'registros_excel': len(consolidado),
             'excel_path': excel_path,
             'resumen_path': resumen_path
         }
@@ -414,7 +719,7 @@ def generar_entregable_consolidado():
         print(f"📁 Carpeta: {entregable_folder}")
         print(f"📊 Excel: {excel_path}")
         print(f"📄 PDFs: {pdfs_copiados} archivos con estructura año/mes/tipo")
-        print(f"📋 Registros: {len(consolidado_data)}")
+        print(f"📋 Registros: {len(consolidado)}")
         print(f"📂 Estructura consolidada de {documentos_procesados} documentos")
         
         return resultado
@@ -431,36 +736,51 @@ def generar_entregable_consolidado():
             'registros_excel': 0
         }
 
+# Textos de tipo de documento y de estado según su número
+TIPOS_DOCUMENTO_TEXTO = {
+    1: "Egreso",
+    2: "Traspaso", 
+    3: "Ingreso",
+    4: "Voucher"
+}
+
+ESTADOS_TEXTO = {
+    1: "Vigente",
+    2: "Pendiente", 
+    3: "Actualizado",
+    4: "Nulo"
+}
+
+# Mismos textos indexados por el valor tal como viene en el CSV ("1", "2", ...)
+_TIPOS_DOCUMENTO_TEXTO_STR = {str(k): v for k, v in TIPOS_DOCUMENTO_TEXTO.items()}
+_ESTADOS_TEXTO_STR = {str(k): v for k, v in ESTADOS_TEXTO.items()}
+
 def obtener_tipo_documento_texto(tipo_num_str):
     """Convierte el número de tipo a texto descriptivo"""
+    texto = _TIPOS_DOCUMENTO_TEXTO_STR.get(tipo_num_str)
+    if texto is not None:
+        return texto
+    
     try:
         if not tipo_num_str or tipo_num_str.strip() == '':
             return "Sin tipo"
             
         tipo_num = int(tipo_num_str.strip())
-        tipos = {
-            1: "Egreso",
-            2: "Traspaso", 
-            3: "Ingreso",
-            4: "Voucher"
-        }
-        return tipos.get(tipo_num, f"Tipo {tipo_num}")
-    except (ValueError, TypeError):
+        return TIPOS_DOCUMENTO_TEXTO.get(tipo_num, f"Tipo {tipo_num}")
+    except (ValueError, TypeError, AttributeError):
         return "Sin tipo"
 
 def obtener_estado_texto(estado_num_str):
     """Convierte el número de estado a texto descriptivo"""
+    texto = _ESTADOS_TEXTO_STR.get(estado_num_str)
+    if texto is not None:
+        return texto
+    
     try:
         if not estado_num_str or estado_num_str.strip() == '':
             return "Sin estado"
             
         estado_num = int(estado_num_str.strip())
-        estados = {
-            1: "Vigente",
-            2: "Pendiente", 
-            3: "Actualizado",
-            4: "Nulo"
-        }
-        return estados.get(estado_num, f"Estado {estado_num}")
-    except (ValueError, TypeError):
+        return ESTADOS_TEXTO.get(estado_num, f"Estado {estado_num}")
+    except (ValueError, TypeError, AttributeError):
         return "Sin estado"
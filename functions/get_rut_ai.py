@@ -12,7 +12,12 @@ import re
 import json
 import base64
 import configparser
+import hashlib
 import math
+import shelve
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from io import BytesIO
 from pathlib import Path
 import pandas as pd
@@ -21,19 +26,88 @@ import cv2
 import numpy as np
 from PIL import Image
 
+try:
+    # libjpeg-turbo (SIMD) para codificar los recortes; necesita la librería del sistema
+    from turbojpeg import TurboJPEG, TJPF_GRAY, TJPF_RGB, TJPF_BGR, TJSAMP_420, TJSAMP_GRAY
+    _turbo_jpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    _turbo_jpeg = None
+
+try:
+    # Hash rápido para la caché de respuestas; si no está se usa blake2b
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    # Parser/serializador JSON en Rust; si no está se usa el módulo json
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    # base64 vectorizado (SSE/AVX); si no está se usa el módulo base64
+    import pybase64
+except ImportError:
+    pybase64 = None
+
+try:
+    from functions.excel import escribir_excel
+except ImportError:
+    # Ejecutado como script (python get_rut_ai.py)
+    from excel import escribir_excel
+
 # OpenAI SDK (2025)
 try:
     from openai import OpenAI
 except Exception:
     OpenAI = None
 
+# Llamadas simultáneas a la API de visión (el cuello de botella es la latencia remota)
+AI_MAX_WORKERS = 10
+# Comprobantes por llamada: el prompt se envía una vez por lote
+AI_BATCH_SIZE = 4
+# Reintentos del SDK ante 429/5xx, con backoff exponencial
+OPENAI_MAX_RETRIES = 5
+# Tiempo máximo por llamada (segundos)
+OPENAI_TIMEOUT = 60.0
+# Caché en disco de respuestas de la API por contenido de la imagen (None la desactiva)
+AI_CACHE_PATH = os.path.join("ENTREGABLES", ".ai_cache")
+_ai_cache_lock = threading.Lock()
+
+
+def _json_loads(text):
+    """json.loads, con orjson si está disponible"""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def _json_dumps(data):
+    """json.dumps(ensure_ascii=False), con orjson si está disponible"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data).decode("utf-8")
+        except TypeError:
+            # p. ej. enteros de más de 64 bits, que orjson no serializa
+            pass
+    return json.dumps(data, ensure_ascii=False)
+
 
 def read_api_key(config_path="config.conf"):
-    """Lee la API key desde config.conf"""
-    cfg = configparser.ConfigParser()
-    if not os.path.exists(config_path):
+    """Lee la API key desde config.conf (se vuelve a parsear solo si el archivo cambió)"""
+    try:
+        mtime = os.stat(config_path).st_mtime_ns
+    except OSError:
         print(f"❌ No se encontró {config_path}")
         return None
+    return _read_api_key_cached(config_path, mtime)
+
+
+@lru_cache(maxsize=4)
+def _read_api_key_cached(config_path, mtime):
+    """Parsea config.conf; la caché se invalida con la fecha de modificación"""
+    cfg = configparser.ConfigParser()
     cfg.read(config_path)
     try:
         key = cfg.get("OPENAI", "key").strip()
@@ -62,7 +136,8 @@ def detect_table_region(image_path):
         if img is None:
             return None
             
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        # Acepta también una imagen ya en escala de grises
+        gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
         
         # Detectar bordes
         edges = cv2.Canny(gray, 50, 150, apertureSize=3)
@@ -74,11 +149,14 @@ def detect_table_region(image_path):
         min_area = (img.shape[0] * img.shape[1]) * 0.1  # Al menos 10% de la imagen
         
         best_contour = None
-        best_area = 0
         
-        for contour in contours:
-            area = cv2.contourArea(contour)
-            if area > min_area and area > best_area:
+        # Filtrar por área con NumPy y aproximar solo los candidatos, de mayor a menor:
+        # el primero con 4 vértices es el rectángulo más grande
+        if contours:
+            areas = np.fromiter((cv2.contourArea(c) for c in contours), dtype=np.float64, count=len(contours))
+            candidatos = np.flatnonzero(areas > min_area)
+            for i in candidatos[np.argsort(-areas[candidatos], kind="stable")]:
+                contour = contours[i]
                 # Aproximar a polígono
                 epsilon = 0.02 * cv2.arcLength(contour, True)
                 approx = cv2.approxPolyDP(contour, epsilon, True)
@@ -86,7 +164,7 @@ def detect_table_region(image_path):
                 # Si tiene 4 vértices (rectángulo aproximado)
                 if len(approx) == 4:
                     best_contour = approx
-                    best_area = area
+                    break
         
         if best_contour is not None:
             return best_contour.reshape(-1, 2).tolist()
@@ -112,14 +190,12 @@ def order_points(pts):
     [top-left, top-right, bottom-right, bottom-left]
     """
     pts = np.array(pts, dtype="float32")
-    s = pts.sum(axis=1)               # x + y
-    diff = np.diff(pts, axis=1)       # y - x
-
-    tl = pts[np.argmin(s)]
-    br = pts[np.argmax(s)]
-    tr = pts[np.argmin(diff)]
-    bl = pts[np.argmax(diff)]
-    return np.array([tl, tr, br, bl], dtype="float32")
+    # Ordenar por ángulo alrededor del centroide (sentido horario en la imagen,
+    # con y hacia abajo) y rotar para que el primero sea el de menor x + y
+    centro = pts.mean(axis=0)
+    angulos = np.arctan2(pts[:, 1] - centro[1], pts[:, 0] - centro[0])
+    rect = pts[np.argsort(angulos)]
+    return np.roll(rect, -int(np.argmin(rect.sum(axis=1))), axis=0)
 
 
 def four_point_transform(image, pts):
@@ -127,6 +203,15 @@ def four_point_transform(image, pts):
     rect = order_points(pts)
     (tl, tr, br, bl) = rect
 
+    # Rectángulo alineado a los ejes con coordenadas enteras (p. ej. la región
+    # central de respaldo de detect_table_region): basta un recorte sin copia
+    if (tl[1] == tr[1] and bl[1] == br[1] and tl[0] == bl[0] and tr[0] == br[0]
+            and np.array_equal(rect, np.round(rect))):
+        x0, y0 = max(int(tl[0]), 0), max(int(tl[1]), 0)
+        x1, y1 = int(br[0]), int(br[1])
+        if x1 > x0 and y1 > y0:
+            return image[y0:y1, x0:x1]
+
     # calcular ancho/alto max del nuevo plano
     widthA = math.dist(br, bl)
     widthB = math.dist(tr, tl)
@@ -150,50 +235,78 @@ def four_point_transform(image, pts):
 
 
 def pil_to_jpeg_bytes(pil_img, quality=90):
-    """Convierte imagen PIL a bytes JPEG"""
+    """Convierte imagen PIL a bytes JPEG (con libjpeg-turbo si está disponible)"""
+    if _turbo_jpeg is not None and pil_img.mode in ("L", "RGB"):
+        gris = pil_img.mode == "L"
+        return _turbo_jpeg.encode(np.asarray(pil_img), quality=quality,
+                                  pixel_format=TJPF_GRAY if gris else TJPF_RGB,
+                                  jpeg_subsample=TJSAMP_GRAY if gris else TJSAMP_420)
     buf = BytesIO()
     pil_img.save(buf, format="JPEG", quality=quality)
     return buf.getvalue()
 
 
+def ndarray_to_jpeg_bytes(img, quality=90):
+    """
+    Convierte una imagen OpenCV (escala de grises o BGR) a bytes JPEG sin pasar
+    por PIL: libjpeg-turbo si está disponible, si no cv2.imencode
+    """
+    gris = img.ndim == 2
+    if _turbo_jpeg is not None:
+        return _turbo_jpeg.encode(np.ascontiguousarray(img), quality=quality,
+                                  pixel_format=TJPF_GRAY if gris else TJPF_BGR,
+                                  jpeg_subsample=TJSAMP_GRAY if gris else TJSAMP_420)
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("No se pudo codificar la imagen como JPEG")
+    return buf.tobytes()
+
+
+# Bloque JSON (lista u objeto) dentro de una respuesta con texto adicional
+_JSON_BLOCK_RE = re.compile(r"(\[.*\]|\{.*\})", re.DOTALL)
+
+
 def ensure_json(text):
     """
     Intenta recuperar un JSON válido desde la respuesta.
     """
-    # si ya es JSON
+    # si ya es JSON (solo se intenta si empieza como lista u objeto)
     try:
-        data = json.loads(text)
+        if text.lstrip()[:1] not in ("[", "{"):
+            raise ValueError("no empieza como JSON")
+        data = _json_loads(text)
         # Normaliza a lista de objetos
         if isinstance(data, dict) and "items" in data and isinstance(data["items"], list):
-            return json.dumps(data["items"], ensure_ascii=False)
+            return _json_dumps(data["items"])
         if isinstance(data, list):
-            return json.dumps(data, ensure_ascii=False)
+            return _json_dumps(data)
         # Si viene dict con otra llave, intenta encontrar una lista dentro
         for v in (data.values() if isinstance(data, dict) else []):
             if isinstance(v, list):
-                return json.dumps(v, ensure_ascii=False)
+                return _json_dumps(v)
         # último recurso: devuélvelo como objeto
-        return json.dumps(data, ensure_ascii=False)
+        return _json_dumps(data)
     except Exception:
         pass
 
     # intenta extraer bloque JSON con regex
-    m = re.search(r"(\[.*\]|\{.*\})", text, flags=re.DOTALL)
+    m = _JSON_BLOCK_RE.search(text)
     if m:
         try:
-            data = json.loads(m.group(1))
+            data = _json_loads(m.group(1))
             if isinstance(data, dict) and "items" in data and isinstance(data["items"], list):
-                return json.dumps(data["items"], ensure_ascii=False)
+                return _json_dumps(data["items"])
             if isinstance(data, list):
-                return json.dumps(data, ensure_ascii=False)
-            return json.dumps(data, ensure_ascii=False)
+                return _json_dumps(data)
+            return _json_dumps(data)
         except Exception:
             pass
 
     # si todo falla, envuelve como error
-    return json.dumps({"error": "Respuesta no JSON", "raw": text[:500]}, ensure_ascii=False)
+    return _json_dumps({"error": "Respuesta no JSON", "raw": text[:500]})
 
 
+@lru_cache(maxsize=1)
 def build_prompt():
     """Construye el prompt para OpenAI"""
     return (
@@ -209,14 +322,105 @@ def build_prompt():
     )
 
 
-def call_openai_vision(api_key, pil_cropped, model="gpt-4o-mini"):
-    """Llama a OpenAI Vision API para extraer datos de la tabla"""
+def _clave_cache_ai(img, model, detail, prompt):
+    """
+    Clave de caché: hash de los píxeles enviados, el modelo, el nivel de detalle y
+    el texto del prompt (al cambiar el prompt, o entre llamada simple y por lote,
+    la respuesta guardada ya no sirve)
+    """
+    h = xxhash.xxh3_64() if xxhash is not None else hashlib.blake2b(digest_size=16)
+    h.update(f"{model}|{detail}|{img.shape}|".encode("utf-8"))
+    h.update(prompt.encode("utf-8"))
+    h.update(np.ascontiguousarray(img).data)
+    return h.hexdigest()
+
+
+def _leer_cache_ai(clave):
+    """Respuesta guardada para la clave, o None"""
+    if not AI_CACHE_PATH:
+        return None
+    try:
+        with _ai_cache_lock, shelve.open(AI_CACHE_PATH, flag="r") as db:
+            return db.get(clave)
+    except Exception:
+        # La caché aún no existe o no se puede leer
+        return None
+
+
+def _guardar_cache_ai(clave, contenido):
+    """Guarda una respuesta válida en la caché (los errores no se guardan)"""
+    if not AI_CACHE_PATH:
+        return
+    try:
+        os.makedirs(os.path.dirname(AI_CACHE_PATH) or ".", exist_ok=True)
+        with _ai_cache_lock, shelve.open(AI_CACHE_PATH) as db:
+            db[clave] = contenido
+    except Exception as e:
+        print(f"  ⚠️  No se pudo guardar en la caché de IA: {e}")
+
+
+def _preparar_imagen_envio(img_cropped, max_side):
+    """
+    Deja la imagen lista para enviar: escala de grises (array OpenCV) con su lado
+    mayor limitado a max_side píxeles. Acepta arrays OpenCV (gris o BGR) o PIL
+    """
+    if isinstance(img_cropped, Image.Image):
+        img = np.asarray(img_cropped.convert("L"))
+    elif img_cropped.ndim == 3:
+        img = cv2.cvtColor(img_cropped, cv2.COLOR_BGR2GRAY)
+    else:
+        img = img_cropped
+    h, w = img.shape[:2]
+    factor = max_side / max(h, w)
+    if factor < 1:
+        img = cv2.resize(img, (max(1, round(w * factor)), max(1, round(h * factor))),
+                         interpolation=cv2.INTER_AREA)
+    return img
+
+
+def _image_url(img):
+    """Data URL JPEG (base64) de un array OpenCV"""
+    b64encode = pybase64.b64encode if pybase64 is not None else base64.b64encode
+    img_b64 = b64encode(ndarray_to_jpeg_bytes(img, quality=85)).decode("ascii")
+    return f"data:image/jpeg;base64,{img_b64}"
+
+
+def _cliente_openai(api_key):
+    """
+    Cliente de OpenAI con reintentos ante 429/5xx. Se crea una vez por API key y se
+    comparte entre hilos, reutilizando las conexiones HTTP (keep-alive) entre llamadas
+    """
     if OpenAI is None:
         raise RuntimeError("Paquete 'openai' no disponible. Instala con: pip install openai")
+    return _cliente_openai_cached(api_key)
+
+
+@lru_cache(maxsize=1)
+def _cliente_openai_cached(api_key):
+    return OpenAI(api_key=api_key, timeout=OPENAI_TIMEOUT, max_retries=OPENAI_MAX_RETRIES)
+
+
+def call_openai_vision(api_key, img_cropped, model="gpt-4o-mini", max_side=1600, detail="high",
+                       force=False):
+    """
+    Llama a OpenAI Vision API para extraer datos de la tabla.
+    img_cropped puede ser un array OpenCV (gris o BGR) o una imagen PIL.
+    La imagen se envía en escala de grises y con su lado mayor limitado a max_side
+    píxeles: menos bytes que subir y menos tokens de imagen, sin perder legibilidad.
+    detail="high" porque los dígitos de los RUT no se leen con la versión "low" (512 px).
+    Con force=True no se usa la respuesta guardada en la caché (la nueva sí se guarda)
+    """
+    img = _preparar_imagen_envio(img_cropped, max_side)
 
-    client = OpenAI(api_key=api_key)
-    img_b64 = base64.b64encode(pil_to_jpeg_bytes(pil_cropped, quality=92)).decode("utf-8")
-    image_url = f"data:image/jpeg;base64,{img_b64}"
+    # Imagen ya procesada antes (re-ejecución del entregable): no se vuelve a enviar,
+    # ni hace falta el cliente (ni el paquete openai) para devolverla
+    clave = _clave_cache_ai(img, model, detail, build_prompt())
+    cacheado = None if force else _leer_cache_ai(clave)
+    if cacheado is not None:
+        return cacheado
+
+    client = _cliente_openai(api_key)
+    image_url = _image_url(img)
 
     try:
         resp = client.chat.completions.create(
@@ -229,7 +433,7 @@ def call_openai_vision(api_key, pil_cropped, model="gpt-4o-mini"):
                     "role": "user",
                     "content": [
                         {"type": "text", "text": build_prompt()},
-                        {"type": "image_url", "image_url": {"url": image_url}}
+                        {"type": "image_url", "image_url": {"url": image_url, "detail": detail}}
                     ]
                 }
             ],
@@ -237,73 +441,239 @@ def call_openai_vision(api_key, pil_cropped, model="gpt-4o-mini"):
         content = resp.choices[0].message.content.strip()
         # Forzamos a que sea lista pura
         content = ensure_json(content)
+        if not content.startswith('{"error"'):
+            _guardar_cache_ai(clave, content)
         return content
     except Exception as e:
-        return json.dumps({"error": f"OpenAI error: {str(e)}"}, ensure_ascii=False)
+        return _json_dumps({"error": f"OpenAI error: {str(e)}"})
+
+
+@lru_cache(maxsize=1)
+def build_prompt_batch():
+    """Prompt para varias imágenes en una sola llamada"""
+    return (
+        build_prompt() + "\n\n"
+        "Recibirás VARIAS imágenes numeradas, cada una con su propia TABLA.\n"
+        "- Devuelve un objeto JSON {\"imagenes\": [...]} con una lista por cada imagen, "
+        "en el mismo orden en que se entregan: [[{\"rut\":\"..\",\"nombre\":\"..\"}], [], ...]\n"
+        "- La cantidad de listas debe ser igual a la cantidad de imágenes."
+    )
+
+
+def call_openai_vision_batch(api_key, imgs_cropped, model="gpt-4o-mini", max_side=1600, detail="high",
+                             force=False):
+    """
+    Igual que call_openai_vision pero para varias imágenes en una sola llamada:
+    el prompt se envía una vez por lote en vez de una vez por imagen.
+    Si la respuesta no trae una lista por imagen se consulta cada una por separado.
+
+    Returns:
+        list: JSON string por imagen, en el mismo orden
+    """
+    if len(imgs_cropped) == 1:
+        return [call_openai_vision(api_key, imgs_cropped[0], model=model, max_side=max_side, detail=detail,
+                                   force=force)]
+
+    imgs = [_preparar_imagen_envio(img, max_side) for img in imgs_cropped]
+    claves = [_clave_cache_ai(img, model, detail, build_prompt_batch()) for img in imgs]
+    if force:
+        resultados = [None] * len(imgs)
+    else:
+        # Antes de armar el lote se busca cada imagen en la caché, con la clave de
+        # lote y con la de llamada simple (las imágenes de un lote con respuesta
+        # inválida quedaron guardadas así): no se repite el lote que falló
+        resultados = [_leer_cache_ai(clave) or _leer_cache_ai(_clave_cache_ai(img, model, detail, build_prompt()))
+                      for img, clave in zip(imgs, claves)]
+    faltantes = [i for i, r in enumerate(resultados) if r is None]
+
+    if len(faltantes) == 1:
+        i = faltantes[0]
+        resultados[i] = call_openai_vision(api_key, imgs[i], model=model, max_side=max_side, detail=detail,
+                                           force=force)
+        return resultados
+    if not faltantes:
+        return resultados
+
+    client = _cliente_openai(api_key)
+    contenido = [{"type": "text", "text": build_prompt_batch()}]
+    for n, i in enumerate(faltantes, start=1):
+        contenido.append({"type": "text", "text": f"Imagen {n}:"})
+        contenido.append({"type": "image_url", "image_url": {"url": _image_url(imgs[i]), "detail": detail}})
+
+    try:
+        resp = client.chat.completions.create(
+            model=model,
+            temperature=0,
+            response_format={"type": "json_object"},
+            messages=[
+                {"role": "system", "content": "Eres un extractor OCR que SOLO devuelve JSON válido."},
+                {"role": "user", "content": contenido}
+            ],
+        )
+        content = resp.choices[0].message.content.strip()
+    except Exception as e:
+        error = _json_dumps({"error": f"OpenAI error: {str(e)}"})
+        for i in faltantes:
+            resultados[i] = error
+        return resultados
+
+    try:
+        listas = _json_loads(content)["imagenes"]
+        if not isinstance(listas, list) or len(listas) != len(faltantes):
+            raise ValueError("cantidad de listas distinta a la de imágenes")
+    except Exception:
+        # Respuesta de lote inválida: consultar cada imagen por separado
+        print(f"  ⚠️  Respuesta de lote no válida, consultando {len(faltantes)} imágenes por separado")
+        for i in faltantes:
+            resultados[i] = call_openai_vision(api_key, imgs[i], model=model, max_side=max_side, detail=detail,
+                                               force=force)
+        return resultados
+
+    for i, lista in zip(faltantes, listas):
+        resultados[i] = ensure_json(_json_dumps(lista))
+        if not resultados[i].startswith('{"error"'):
+            _guardar_cache_ai(claves[i], resultados[i])
+    return resultados
+
+
+def _recortar_tabla(image_path):
+    """
+    Carga la imagen en escala de grises y recorta la región de la tabla
+
+    Returns:
+        numpy.ndarray: recorte, o None si no se pudo leer la imagen
+    """
+    data = np.fromfile(image_path, dtype=np.uint8)
+    img = cv2.imdecode(data, cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+
+    # La imagen se envía en escala de grises: convertir una vez y enderezar
+    # un solo canal en vez de tres
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+    # Detectar región de tabla automáticamente
+    pts = detect_table_region(gray)
+    if not pts or len(pts) != 4:
+        print(f"  ⚠️  No se pudo detectar tabla, usando imagen completa")
+        return gray
+    print(f"  ✅ Región de tabla detectada")
+    # Recorte por perspectiva
+    return four_point_transform(gray, pts)
+
+
+# RUT chileno, cuerpo de 7 u 8 dígitos y DV (0-9 o K): con guion antes del DV
+# (puntos opcionales) o con todos los puntos (guion opcional). Sin guion ni puntos
+# no se sabe si el último dígito es el DV, así que no se reformatea
+_RUT_RE = re.compile(r"(\d{1,2})\.?(\d{3})\.?(\d{3})-([0-9K])"
+                     r"|(\d{1,2})\.(\d{3})\.(\d{3})([0-9K])", re.IGNORECASE)
 
 
-def extract_ruts_from_image(image_path, api_key):
+def normalizar_rut(rut):
+    """
+    Normaliza un RUT al formato 12.345.678-9 (DV en mayúscula).
+    Si no tiene forma de RUT (o le falta el guion y los puntos) se devuelve sin cambios
+    """
+    if not isinstance(rut, str):
+        return rut
+    m = _RUT_RE.fullmatch("".join(rut.split()))
+    if not m:
+        return rut
+    cuerpo1, cuerpo2, cuerpo3, dv = (g for g in m.groups() if g is not None)
+    return f"{cuerpo1}.{cuerpo2}.{cuerpo3}-{dv.upper()}"
+
+
+def _normalizar_resultado(result_json):
+    """Valida la respuesta y la fuerza al formato esperado: lista de objetos"""
+    try:
+        parsed = _json_loads(result_json)
+        # Si es dict con items, devuélvelo como lista
+        if isinstance(parsed, dict) and "items" in parsed and isinstance(parsed["items"], list):
+            parsed = parsed["items"]
+        # Fuerza formato esperado: lista de objetos
+        if isinstance(parsed, dict):
+            parsed = [parsed]
+        # Corregir el formato de los RUT que el modelo no normalizó
+        for item in parsed:
+            if isinstance(item, dict) and "rut" in item:
+                item["rut"] = normalizar_rut(item["rut"])
+
+        print(f"  ✅ Datos extraídos: {len(parsed)} registros")
+        return _json_dumps(parsed)
+
+    except Exception:
+        print(f"  ❌ Respuesta no válida de OpenAI")
+        return _json_dumps({"error": "Respuesta no válida de OpenAI"})
+
+
+def extract_ruts_from_image(image_path, api_key, force=False):
     """
     Extrae RUTs y nombres de una imagen de comprobante
     
     Args:
         image_path (str): Path a la imagen
         api_key (str): API key de OpenAI
+        force (bool): Consultar a OpenAI aunque haya respuesta en la caché
     
     Returns:
         str: JSON string con los datos extraídos
     """
-    try:
-        print(f"  🔍 Analizando imagen: {os.path.basename(image_path)}")
-        
-        # Cargar imagen
-        data = np.fromfile(image_path, dtype=np.uint8)
-        img = cv2.imdecode(data, cv2.IMREAD_COLOR)
-        if img is None:
-            return json.dumps({"error": "No se pudo leer la imagen"}, ensure_ascii=False)
-        
-        # Detectar región de tabla automáticamente
-        pts = detect_table_region(img)
-        if not pts or len(pts) != 4:
-            print(f"  ⚠️  No se pudo detectar tabla, usando imagen completa")
-            pil_crop = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
-        else:
-            print(f"  ✅ Región de tabla detectada")
-            # Recorte por perspectiva
-            warped = four_point_transform(img, pts)
-            pil_crop = Image.fromarray(cv2.cvtColor(warped, cv2.COLOR_BGR2RGB))
-        
-        # Llamar a OpenAI Vision
-        result_json = call_openai_vision(api_key, pil_crop, model="gpt-4o-mini")
-        
-        # Validar que sea JSON válido
+    return extract_ruts_from_images([image_path], api_key, force=force)[0]
+
+
+def extract_ruts_from_images(image_paths, api_key, force=False):
+    """
+    Extrae RUTs y nombres de varias imágenes de comprobante con una sola
+    llamada a OpenAI Vision
+    
+    Args:
+        image_paths (list): Paths a las imágenes
+        api_key (str): API key de OpenAI
+        force (bool): Consultar a OpenAI aunque haya respuesta en la caché
+    
+    Returns:
+        list: JSON string con los datos extraídos, uno por imagen
+    """
+    resultados = [None] * len(image_paths)
+    recortes = []
+    posiciones = []
+    
+    for pos, image_path in enumerate(image_paths):
         try:
-            parsed = json.loads(result_json)
-            # Si es dict con items, devuélvelo como lista
-            if isinstance(parsed, dict) and "items" in parsed and isinstance(parsed["items"], list):
-                parsed = parsed["items"]
-            # Fuerza formato esperado: lista de objetos
-            if isinstance(parsed, dict):
-                parsed = [parsed]
-            
-            print(f"  ✅ Datos extraídos: {len(parsed)} registros")
-            return json.dumps(parsed, ensure_ascii=False)
-            
-        except Exception:
-            print(f"  ❌ Respuesta no válida de OpenAI")
-            return json.dumps({"error": "Respuesta no válida de OpenAI"}, ensure_ascii=False)
-        
-    except Exception as e:
-        print(f"  ❌ Error procesando imagen: {str(e)}")
-        return json.dumps({"error": f"Error procesando imagen: {str(e)}"}, ensure_ascii=False)
+            print(f"  🔍 Analizando imagen: {os.path.basename(image_path)}")
+            crop = _recortar_tabla(image_path)
+            if crop is None:
+                resultados[pos] = _json_dumps({"error": "No se pudo leer la imagen"})
+                continue
+            recortes.append(crop)
+            posiciones.append(pos)
+        except Exception as e:
+            print(f"  ❌ Error procesando imagen: {str(e)}")
+            resultados[pos] = _json_dumps({"error": f"Error procesando imagen: {str(e)}"})
+    
+    if recortes:
+        try:
+            # Llamar a OpenAI Vision (los arrays van directo al codificador JPEG, sin PIL)
+            respuestas = call_openai_vision_batch(api_key, recortes, model="gpt-4o-mini", force=force)
+            for pos, result_json in zip(posiciones, respuestas):
+                resultados[pos] = _normalizar_resultado(result_json)
+        except Exception as e:
+            print(f"  ❌ Error procesando imagen: {str(e)}")
+            for pos in posiciones:
+                resultados[pos] = _json_dumps({"error": f"Error procesando imagen: {str(e)}"})
+    
+    return resultados
 
 
-def procesar_entregable_con_ai(entregable_num):
+def procesar_entregable_con_ai(entregable_num, force=False):
     """
     Procesa el entregable especificado agregando datos de IA para comprobantes
     
     Args:
         entregable_num (int): Número del entregable a procesar
+        force (bool): Volver a consultar a OpenAI todas las imágenes, sin usar las
+            respuestas guardadas en ENTREGABLES/.ai_cache (por ejemplo, para
+            corregir una extracción mala)
     
     Returns:
         dict: Resultado del procesamiento
@@ -345,54 +715,56 @@ def procesar_entregable_con_ai(entregable_num):
         
         comprobantes_procesados = 0
         errores = 0
+        pendientes = []
         
-        # Procesar cada fila que tenga folio (es comprobante)
-        for index, row in df.iterrows():
-            folio = str(row.get('folio', '')).strip()
-            path_img_completo = str(row.get('path_img_completo', '')).strip()
+        # La columna se acumula como lista (por posición) y se asigna una sola vez al final
+        datos_ai_ruts = df['datos_ai_ruts'].tolist()
+        folios = df['folio'].tolist() if 'folio' in df.columns else [''] * len(df)
+        paths_img = df['path_img_completo'].tolist() if 'path_img_completo' in df.columns else [''] * len(df)
+        
+        # Recolectar cada fila que tenga folio (es comprobante)
+        for pos, (folio, path_img_completo) in enumerate(zip(folios, paths_img)):
+            folio = str(folio).strip()
+            path_img_completo = str(path_img_completo).strip()
+            if not folio:
+                continue
             
             # Solo procesar si tiene folio (es comprobante) y path de imagen
-            if folio and path_img_completo and os.path.exists(path_img_completo):
-                print(f"\n🔄 Procesando comprobante {folio} ({comprobantes_procesados + 1})")
-                
-                # Extraer datos con IA
-                datos_ai = extract_ruts_from_image(path_img_completo, api_key)
-                
-                # Guardar en el DataFrame
-                df.at[index, 'datos_ai_ruts'] = datos_ai
-                comprobantes_procesados += 1
-                
-                print(f"  📝 Datos guardados: {datos_ai[:100]}...")
-                
-            elif folio and not path_img_completo:
+            if not path_img_completo:
                 print(f"  ⚠️  Comprobante {folio}: No se encontró path de imagen")
-                df.at[index, 'datos_ai_ruts'] = json.dumps({"error": "Imagen no encontrada"}, ensure_ascii=False)
+                datos_ai_ruts[pos] = _json_dumps({"error": "Imagen no encontrada"})
                 errores += 1
-            elif folio and not os.path.exists(path_img_completo):
+            elif not os.path.exists(path_img_completo):
                 print(f"  ⚠️  Comprobante {folio}: Imagen no existe en {path_img_completo}")
-                df.at[index, 'datos_ai_ruts'] = json.dumps({"error": "Archivo de imagen no existe"}, ensure_ascii=False)
+                datos_ai_ruts[pos] = _json_dumps({"error": "Archivo de imagen no existe"})
                 errores += 1
+            else:
+                pendientes.append((pos, folio, path_img_completo))
+        
+        # Extraer datos con IA: las llamadas son de red, se lanzan en paralelo
+        if pendientes:
+            print(f"\n🔄 Procesando {len(pendientes)} comprobantes "
+                  f"(lotes de {AI_BATCH_SIZE}, {AI_MAX_WORKERS} en paralelo)")
+            lotes = [pendientes[i:i + AI_BATCH_SIZE] for i in range(0, len(pendientes), AI_BATCH_SIZE)]
+            with ThreadPoolExecutor(max_workers=AI_MAX_WORKERS) as executor:
+                futuros = {
+                    executor.submit(extract_ruts_from_images, [path_img for _, _, path_img in lote], api_key,
+                                    force=force): lote
+                    for lote in lotes
+                }
+                for futuro in as_completed(futuros):
+                    for (pos, folio, _), datos_ai in zip(futuros[futuro], futuro.result()):
+                        datos_ai_ruts[pos] = datos_ai
+                        comprobantes_procesados += 1
+                        
+                        print(f"  📝 Comprobante {folio} ({comprobantes_procesados}/{len(pendientes)}): {datos_ai[:100]}...")
+        
+        # Guardar en el DataFrame
+        df['datos_ai_ruts'] = datos_ai_ruts
         
         # Guardar Excel actualizado
         print(f"\n💾 Guardando Excel actualizado...")
-        with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='Consolidado', index=False)
-            
-            # Obtener worksheet para formatear
-            worksheet = writer.sheets['Consolidado']
-            
-            # Ajustar ancho de columnas
-            for column in worksheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = min(max_length + 2, 80)  # Aumentado para la columna de JSON
-                worksheet.column_dimensions[column_letter].width = adjusted_width
+        escribir_excel(df, excel_path, ancho_maximo=80)  # Más ancho para la columna de JSON
         
         # Actualizar resumen
         resumen_path = os.path.join(entregable_folder, "RESUMEN.txt")
@@ -435,13 +807,14 @@ def procesar_entregable_con_ai(entregable_num):
 def main():
     """Función principal para uso independiente"""
     if len(sys.argv) < 2:
-        print("Uso: python get_rut_ai.py <numero_entregable>")
+        print("Uso: python get_rut_ai.py <numero_entregable> [--force]")
         print("Ejemplo: python get_rut_ai.py 1")
+        print("  --force: no usar las respuestas guardadas en la caché de IA")
         return
     
     try:
         entregable_num = int(sys.argv[1])
-        resultado = procesar_entregable_con_ai(entregable_num)
+        resultado = procesar_entregable_con_ai(entregable_num, force="--force" in sys.argv[2:])
         
         if resultado['success']:
             print("✅ Procesamiento completado exitosamente")
@@ -1,8 +1,11 @@
 import os
 import csv
-import shutil
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache, partial
 from pathlib import Path
+import numpy as np
+import pandas as pd
 try:
     import pymupdf as fitz
 except ImportError:
@@ -12,18 +15,32 @@ except ImportError:
         print("❌ PyMuPDF no está instalado")
         fitz = None
 
+try:
+    from functions.archivos import MODOS_COPIA, copiar_pdf
+except ImportError:
+    # Ejecutado como script (python separador_pdf.py)
+    from archivos import MODOS_COPIA, copiar_pdf
+
+# Copias simultáneas: el trabajo es de E/S, no de CPU
+COPIA_MAX_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# Formatos de fecha aceptados, en orden de prioridad
+FORMATOS_FECHA = ('%d/%m/%Y', '%m/%d/%Y', '%Y-%m-%d', '%Y/%m/%d', '%d-%m-%Y')
+
+@lru_cache(maxsize=4096)
 def extraer_fecha_componentes(fecha_str):
-    """Extrae año y mes de la fecha"""
+    """
+    Extrae año y mes de una fecha probando FORMATOS_FECHA en orden. Solo recibe
+    las fechas que pd.to_datetime no pudo leer (se repiten entre filas: se cachea)
+    """
     try:
         if not fecha_str or fecha_str.strip() == '':
             return None, None
-            
-        # Intentar diferentes formatos de fecha
-        formatos = ['%d/%m/%Y', '%m/%d/%Y', '%Y-%m-%d', '%Y/%m/%d', '%d-%m-%Y']
+        fecha_str = fecha_str.strip()
         
-        for formato in formatos:
+        for formato in FORMATOS_FECHA:
             try:
-                fecha = datetime.strptime(fecha_str.strip(), formato)
+                fecha = datetime.strptime(fecha_str, formato)
                 return fecha.year, fecha.month
             except ValueError:
                 continue
@@ -35,38 +52,128 @@ def extraer_fecha_componentes(fecha_str):
         print(f"❌ Error al procesar fecha '{fecha_str}': {e}")
         return None, None
 
+def _fechas_componentes(fechas):
+    """
+    Año y mes de una lista de fechas (texto sin espacios) en bloque: cada formato
+    de FORMATOS_FECHA se prueba en orden con pd.to_datetime sobre las que siguen
+    sin fecha. Las que ninguno resuelve (fuera del rango de pandas, por ejemplo)
+    pasan por extraer_fecha_componentes
+    
+    Returns:
+        tuple: (años, meses) como listas alineadas con fechas; 0 si no hay fecha válida
+    """
+    valores = np.array(fechas, dtype=object)
+    años = np.zeros(len(valores), dtype=np.int64)
+    meses = np.zeros(len(valores), dtype=np.int64)
+    pendientes = np.flatnonzero(valores != '')
+    
+    for formato in FORMATOS_FECHA:
+        if not pendientes.size:
+            break
+        fechas_ok = pd.to_datetime(pd.Series(valores[pendientes]), format=formato, errors='coerce')
+        ok = fechas_ok.notna().to_numpy()
+        años[pendientes[ok]] = fechas_ok.dt.year.to_numpy()[ok]
+        meses[pendientes[ok]] = fechas_ok.dt.month.to_numpy()[ok]
+        pendientes = pendientes[~ok]
+    
+    for j in pendientes:
+        año, mes = extraer_fecha_componentes(valores[j])
+        if año is not None:
+            años[j], meses[j] = año, mes
+    
+    return años.tolist(), meses.tolist()
+
+TIPOS_DOCUMENTO_NOMBRE = {
+    1: "egreso",
+    2: "traspaso", 
+    3: "ingreso",
+    4: "voucher"
+}
+
+# Mismo mapa con las claves como vienen en el CSV ("1".."4"): se resuelve sin int()
+_TIPOS_DOCUMENTO_NOMBRE_STR = {str(k): v for k, v in TIPOS_DOCUMENTO_NOMBRE.items()}
+
+@lru_cache(maxsize=64)
 def obtener_tipo_documento_nombre(tipo_num_str):
     """Convierte el número de tipo a nombre de documento"""
+    nombre = _TIPOS_DOCUMENTO_NOMBRE_STR.get(tipo_num_str)
+    if nombre is not None:
+        return nombre
+    
     try:
         if not tipo_num_str or tipo_num_str.strip() == '':
             return "sin_tipo"
             
         tipo_num = int(tipo_num_str.strip())
-        tipos = {
-            1: "egreso",
-            2: "traspaso", 
-            3: "ingreso",
-            4: "voucher"
-        }
-        return tipos.get(tipo_num, f"tipo_{tipo_num}")
+        return TIPOS_DOCUMENTO_NOMBRE.get(tipo_num, f"tipo_{tipo_num}")
     except (ValueError, TypeError):
         return "sin_tipo"
 
 def crear_directorio_si_no_existe(path):
-    """Crea directorio si no existe"""
-    if not os.path.exists(path):
+    """Crea directorio si no existe (con un solo intento de creación, sin stat previo)"""
+    try:
         os.makedirs(path)
-        print(f"📁 Directorio creado: {path}")
-        return True
-    return False
+    except FileExistsError:
+        return False
+    print(f"📁 Directorio creado: {path}")
+    return True
 
-def separar_pdfs_por_estructura(doc_name, carpeta_salida="pdfs_estructurados"):
+# Columnas del CSV que usa la separación, con su valor si faltan
+COLUMNAS_SEPARACION = (('folio', ''), ('fecha', ''), ('tipo_documento', ''), ('ocultar', 'NO'))
+
+# Filas por bloque al leer el CSV del documento
+CSV_CHUNK_ROWS = 10000
+
+def _leer_bloques_csv(csv_path, chunksize=CSV_CHUNK_ROWS):
+    """
+    Lee el CSV del documento en streaming con csv.reader, accediendo a las columnas
+    por posición (sin armar un dict por fila), y lo entrega en bloques para que las
+    fechas se resuelvan de una vez. Las líneas vacías se saltan y las filas con
+    campos de más o de menos se toleran, como en DictReader. Los valores vienen
+    sin espacios y ya se sacaron las filas sin folio o con ocultar == 'SI'
+    
+    Yields:
+        tuple: (filas, folios, fechas, tipos_documento) del bloque; filas es el
+            número de cada fila sin contar líneas vacías, como al enumerar un DictReader
+    """
+    # Buffer de 256 KB: menos llamadas a read(); newline='' como pide el módulo csv
+    with open(csv_path, 'r', encoding='utf-8', newline='', buffering=256 * 1024) as f:
+        reader = csv.reader(f)
+        encabezado = next(reader, [])
+        indices = [(encabezado.index(nombre) if nombre in encabezado else None, default)
+                   for nombre, default in COLUMNAS_SEPARACION]
+        
+        bloque = []
+        for i, row in enumerate(row for row in reader if row):
+            n = len(row)
+            folio, fecha, tipo_documento, ocultar = (
+                row[idx].strip() if idx is not None and idx < n else default
+                for idx, default in indices)
+            if not folio or ocultar == 'SI':
+                continue
+            bloque.append((i, folio, fecha, tipo_documento))
+            if len(bloque) >= chunksize:
+                yield tuple(zip(*bloque))
+                bloque = []
+        if bloque:
+            yield tuple(zip(*bloque))
+
+def separar_pdfs_por_estructura(doc_name, carpeta_salida="pdfs_estructurados", link_mode='hardlink',
+                                shard_prefix_len=0, verbose=False):
     """
     Separa PDFs usando estructura: carpeta_salida/año/mes/tipo_documento/folio.pdf
     
     Args:
         doc_name (str): Nombre del documento procesado
         carpeta_salida (str): Carpeta base donde se creará la estructura
+        link_mode (str): 'hardlink' (por defecto), 'reflink' o 'copy'. Con
+            hardlink los PDFs de la estructura comparten datos con los de
+            pdfs_separados: deben tratarse como de solo lectura
+        shard_prefix_len (int): Si es mayor que 0, agrega una subcarpeta con los
+            primeros caracteres del folio (tipo_documento/19/19120264.pdf) para
+            que ninguna carpeta acumule decenas de miles de PDFs
+        verbose (bool): Imprimir cada PDF copiado y cada advertencia por fila;
+            si no, solo el resumen final (los errores quedan en 'errores')
     
     Returns:
         dict: Resultado del procesamiento con estadísticas
@@ -79,6 +186,13 @@ def separar_pdfs_por_estructura(doc_name, carpeta_salida="pdfs_estructurados"):
             'pdfs_creados': 0
         }
     
+    if link_mode not in MODOS_COPIA:
+        return {
+            'success': False,
+            'error': f'link_mode no válido: {link_mode} (usar {", ".join(MODOS_COPIA)})',
+            'pdfs_creados': 0
+        }
+    
     try:
         # Rutas base
         doc_folder = os.path.join('documentos', doc_name)
@@ -100,16 +214,8 @@ def separar_pdfs_por_estructura(doc_name, carpeta_salida="pdfs_estructurados"):
                 'pdfs_creados': 0
             }
         
-        # Leer datos del CSV
-        print(f"📖 Leyendo datos de {csv_path}")
-        rows = []
-        with open(csv_path, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            rows = list(reader)
-        
         # Crear carpeta base
         base_salida = os.path.join(carpeta_salida, doc_name)
-        crear_directorio_si_no_existe(carpeta_salida)
         crear_directorio_si_no_existe(base_salida)
         
         # Estadísticas
@@ -117,61 +223,115 @@ def separar_pdfs_por_estructura(doc_name, carpeta_salida="pdfs_estructurados"):
         pdfs_sin_fecha = 0
         pdfs_sin_tipo = 0
         errores = []
+        # (fila, folio, pdf_original, pdf_destino, etiqueta) a copiar y carpetas que necesitan
+        copias = []
+        directorios = set()
+        # (año, mes, tipo_documento) -> (carpeta destino con separador final, etiqueta)
+        destinos_por_clave = {}
+        prefijo_original = os.path.join(pdfs_separados_folder, '')
         
-        print(f"🔄 Procesando {len(rows)} registros...")
+        # Inventario de pdfs_separados en una sola pasada: un folio sin PDF se
+        # detecta con una búsqueda en el set en vez de un stat por fila
+        with os.scandir(pdfs_separados_folder) as entradas:
+            pdfs_disponibles = {entrada.name[:-4] for entrada in entradas
+                                if entrada.name.endswith('.pdf') and entrada.is_file()}
         
-        # Procesar cada fila del CSV
-        for i, row in enumerate(rows):
-            try:
-                folio = row.get('folio', '').strip()
-                fecha_str = row.get('fecha', '').strip()
-                tipo_documento_num = row.get('tipo_documento', '').strip()
-                ocultar = row.get('ocultar', 'NO').strip()
-                
-                # Saltar si no hay folio o está marcado para ocultar
-                if not folio or ocultar == 'SI':
+        # Procesar cada fila del CSV (se lee por bloques, sin cargarlo entero)
+        print(f"📖 Leyendo datos de {csv_path}")
+        print(f"🔄 Procesando registros...")
+        
+        for filas, folios, fechas, tipos_documento in _leer_bloques_csv(csv_path):
+            # Año y mes de todas las fechas del bloque de una vez
+            años, meses = _fechas_componentes(fechas)
+            for i, folio, año, mes, tipo_documento_num in zip(
+                    filas, folios, años, meses, tipos_documento):
+                try:
+                    # año y mes quedan como enteros; 0 es "sin fecha"
+                    if año == 0:
+                        pdfs_sin_fecha += 1
+                        if verbose:
+                            print(f"⚠️  Folio {folio}: Sin fecha válida, usando carpeta 'sin_fecha'")
+                    
+                    # Obtener tipo de documento
+                    tipo_documento = obtener_tipo_documento_nombre(tipo_documento_num)
+                    if tipo_documento == 'sin_tipo':
+                        pdfs_sin_tipo += 1
+                        if verbose:
+                            print(f"⚠️  Folio {folio}: Sin tipo válido, usando carpeta 'sin_tipo'")
+                    
+                    # Estructura de directorios: base/año/mes/tipo_documento/ (se arma
+                    # una vez por carpeta; las filas siguientes la toman del dict)
+                    clave = (año, mes, tipo_documento)
+                    destino = destinos_por_clave.get(clave)
+                    if destino is None:
+                        # Sin fecha la carpeta es base/sin_fecha/tipo_documento/
+                        if año:
+                            año_str, mes_str = str(año), f"{mes:02d}"
+                            carpeta_fecha = os.path.join(año_str, mes_str)
+                        else:
+                            año_str, mes_str = 'sin_fecha', '00'
+                            carpeta_fecha = año_str
+                        directorio_destino = os.path.join(base_salida, carpeta_fecha, tipo_documento)
+                        etiqueta = f"{año_str}/{mes_str}/{tipo_documento}/"
+                        destino = destinos_por_clave[clave] = (directorio_destino + os.sep, etiqueta)
+                    prefijo_destino, etiqueta = destino
+                    
+                    if shard_prefix_len > 0:
+                        prefijo_destino = f"{prefijo_destino}{folio[:shard_prefix_len]}{os.sep}"
+                        etiqueta = f"{etiqueta}{folio[:shard_prefix_len]}/"
+                    directorio_destino = prefijo_destino[:-1]
+                    
+                    # Buscar PDF original en pdfs_separados (en el inventario, sin stat)
+                    if folio not in pdfs_disponibles:
+                        error_msg = f"PDF no encontrado para folio {folio}"
+                        errores.append(error_msg)
+                        if verbose:
+                            print(f"❌ {error_msg}")
+                        continue
+                    pdf_original = f"{prefijo_original}{folio}.pdf"
+                    pdf_destino = f"{prefijo_destino}{folio}.pdf"
+                    
+                    # Se copia después, en paralelo
+                    directorios.add(directorio_destino)
+                    copias.append((i, folio, pdf_original, pdf_destino, etiqueta))
+                    
+                except Exception as e:
+                    error_msg = f"Error procesando fila {i+1}: {str(e)}"
+                    errores.append(error_msg)
+                    if verbose:
+                        print(f"❌ {error_msg}")
                     continue
-                
-                # Extraer año y mes de la fecha
-                año, mes = extraer_fecha_componentes(fecha_str)
-                if año is None or mes is None:
-                    año, mes = 'sin_fecha', '00'
-                    pdfs_sin_fecha += 1
-                    print(f"⚠️  Folio {folio}: Sin fecha válida, usando carpeta 'sin_fecha'")
-                
-                # Obtener tipo de documento
-                tipo_documento = obtener_tipo_documento_nombre(tipo_documento_num)
-                if tipo_documento == 'sin_tipo':
-                    pdfs_sin_tipo += 1
-                    print(f"⚠️  Folio {folio}: Sin tipo válido, usando carpeta 'sin_tipo'")
-                
-                # Crear estructura de directorios: base/año/mes/tipo_documento/
-                if año == 'sin_fecha':
-                    directorio_destino = os.path.join(base_salida, 'sin_fecha', tipo_documento)
-                else:
-                    directorio_destino = os.path.join(base_salida, str(año), f"{mes:02d}", tipo_documento)
-                
-                crear_directorio_si_no_existe(directorio_destino)
-                
-                # Buscar PDF original en pdfs_separados
-                pdf_original = os.path.join(pdfs_separados_folder, f"{folio}.pdf")
-                pdf_destino = os.path.join(directorio_destino, f"{folio}.pdf")
-                
-                if os.path.exists(pdf_original):
-                    # Copiar PDF a la nueva estructura
-                    shutil.copy2(pdf_original, pdf_destino)
-                    pdfs_creados += 1
-                    print(f"✅ Copiado: {folio}.pdf -> {año}/{mes:02d if isinstance(mes, int) else mes}/{tipo_documento}/")
-                else:
+        
+        # Crear las carpetas antes de copiar, una vez cada una, para que los
+        # hilos no compitan creándolas
+        for directorio_destino in sorted(directorios):
+            crear_directorio_si_no_existe(directorio_destino)
+        
+        # Copiar PDFs a la nueva estructura (E/S: en paralelo con hilos)
+        print(f"📋 Copiando {len(copias)} PDFs...")
+        # Un folio repetido en el CSV apunta al mismo destino: se copia una sola vez
+        # (dos hilos sobre el mismo archivo se pisarían) y el resultado vale para todas sus filas
+        unicas = list({pdf_destino: (pdf_original, pdf_destino)
+                       for _, _, pdf_original, pdf_destino, _ in copias}.values())
+        with ThreadPoolExecutor(max_workers=COPIA_MAX_WORKERS) as executor:
+            errores_por_destino = dict(zip(
+                (pdf_destino for _, pdf_destino in unicas),
+                executor.map(partial(copiar_pdf, link_mode=link_mode), unicas)))
+        
+        for i, folio, pdf_original, pdf_destino, etiqueta in copias:
+            error = errores_por_destino[pdf_destino]
+            if error is None:
+                pdfs_creados += 1
+                if verbose:
+                    print(f"✅ Copiado: {os.path.basename(pdf_destino)} -> {etiqueta}")
+            else:
+                if isinstance(error, FileNotFoundError) and error.filename == pdf_original:
                     error_msg = f"PDF no encontrado para folio {folio}"
-                    errores.append(error_msg)
-                    print(f"❌ {error_msg}")
-                
-            except Exception as e:
-                error_msg = f"Error procesando fila {i+1}: {str(e)}"
+                else:
+                    error_msg = f"Error procesando fila {i+1}: {str(error)}"
                 errores.append(error_msg)
-                print(f"❌ {error_msg}")
-                continue
+                if verbose:
+                    print(f"❌ {error_msg}")
         
         # Crear reporte de resultados
         resultado = {
@@ -206,14 +366,29 @@ def listar_estructura_creada(carpeta_base):
         return
     
     print(f"\n📁 Estructura creada en: {carpeta_base}")
-    for root, dirs, files in os.walk(carpeta_base):
-        level = root.replace(carpeta_base, '').count(os.sep)
-        indent = ' ' * 2 * level
-        print(f"{indent}{os.path.basename(root)}/")
-        subindent = ' ' * 2 * (level + 1)
-        for file in files:
-            if file.endswith('.pdf'):
-                print(f"{subindent}{file}")
+    # Se arma el listado completo y se imprime de una vez
+    print("\n".join(_lineas_estructura(carpeta_base, os.path.basename(carpeta_base), 0)))
+
+def _lineas_estructura(carpeta, nombre, level):
+    """
+    Líneas del árbol de carpetas y PDFs (como os.walk de arriba hacia abajo), con
+    os.scandir: el tipo de cada entrada viene del listado, sin un stat por archivo
+    """
+    indent = ' ' * 2 * level
+    yield f"{indent}{nombre}/"
+    
+    subcarpetas = []
+    with os.scandir(carpeta) as entradas:
+        for entrada in entradas:
+            if entrada.is_dir():
+                # Igual que os.walk: los enlaces a carpetas no se recorren
+                if not entrada.is_symlink():
+                    subcarpetas.append(entrada)
+            elif entrada.name.endswith('.pdf'):
+                yield f"{indent}  {entrada.name}"
+    
+    for subcarpeta in subcarpetas:
+        yield from _lineas_estructura(subcarpeta.path, subcarpeta.name, level + 1)
 
 # Función de ejemplo para uso independiente
 def main():